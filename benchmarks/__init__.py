@@ -0,0 +1,4 @@
+import os
+import sys
+root_dir = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, os.path.abspath(root_dir))
@@ -0,0 +1,249 @@
+# reproducible benchmarks of the hot paths; run as `python -m benchmarks.run --help`
+from typing import Callable, Dict, List, NamedTuple
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import click
+from click.testing import CliRunner
+from examples.problems_generator import generate
+from models import ExamGenerator, ProblemSet
+from ui.scoring import ExamScore
+import cli
+
+
+class Scale(NamedTuple):
+    num_questions: int  # size of the problem set
+    num_exams: int
+    exam_questions: int  # questions per exam
+
+
+SCALES = {
+    'small': Scale(100, 10, 20),
+    'medium': Scale(10000, 1000, 50),
+    'large': Scale(100000, 100000, 50)
+}
+"""Dict[str, Scale]: synthetic workloads; `large` needs a few GB of disk and a lot of patience"""
+
+SEED = 1
+THRESHOLD = 1.25
+"""float: default slowdown ratio (current / baseline) reported as a regression"""
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(ROOT_DIR, 'main.py')
+STARTUP_PROBLEM_SET = os.path.join(ROOT_DIR, 'examples', 'problems.yml')
+"""str: small problem set of the start-up benchmarks, which shouldn't depend on the scale"""
+
+IMPORT_BUDGET = 0.5
+"""float: seconds that `import cli` may take (as reported by `python -X importtime`);
+exceeding it fails the run, like a regression does"""
+
+
+def measure(function: Callable, repeat: int, self_timed: bool = False) -> Dict[str, float]:
+    """
+    Returns the best and median wall time of `function` in seconds;
+    `self_timed` functions return the time to record themselves
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        seconds = function()
+        times.append(seconds if self_timed else time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def run_cli(*args: str, importtime: bool = False) -> str:
+    """Runs the CLI in a fresh interpreter, like a user would; returns its stderr"""
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), MAIN_PATH, *args]
+    return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True).stderr
+
+
+def import_time(module: str) -> float:
+    """Returns the cumulative import time of a top-level module of the CLI, in seconds"""
+    # lines look like `import time: <self us> | <cumulative us> | <indented module>`
+    for line in run_cli('--help', importtime=True).splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module and fields[1].strip().isdigit():
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"`{module}` wasn't imported by the CLI")
+
+
+def answer_randomly(exam, rng):
+    for question in exam.questions:
+        for answer in question.answers:
+            answer.is_selected = rng.random() < 0.5
+    exam.user_name = f"user{rng.randrange(10 ** 9)}"
+    exam.was_user_completed = True
+
+
+def run_benchmarks(scale: Scale, repeat: int, directory: str,
+                   names: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Runs the benchmarks (all of them, unless `names` are given) on a synthetic
+    problem set stored in `directory`
+    """
+    rng = random.Random(SEED)
+    meta = generate("Benchmark", scale.num_questions, 5, rng=rng)
+    meta_path = os.path.join(directory, 'problems.yml')
+    meta.save(meta_path)
+    meta = ProblemSet.from_file(meta_path)
+    exam_questions = min(scale.exam_questions, scale.num_questions)
+    results = dict()
+
+    def bench(name: str, function: Callable, items: int, self_timed: bool = False):
+        if names and name not in names:
+            return
+        result = measure(function, repeat, self_timed)
+        result['items'] = items
+        result['items_per_second'] = items / result['min'] if result['min'] > 0 else None
+        results[name] = result
+
+    # start-up of a fresh interpreter, which every command pays
+    bench('startup_help', lambda: run_cli('--help'), 1)
+    bench('startup_list_questions', lambda: run_cli('-s', STARTUP_PROBLEM_SET,
+                                                    'list-questions', '--hide-answers'), 1)
+    bench('cli_import', lambda: import_time('cli'), 1, self_timed=True)
+    if 'cli_import' in results:
+        results['cli_import']['budget'] = IMPORT_BUDGET
+
+    bench('problem_set_load', lambda: ProblemSet.from_file(meta_path), scale.num_questions)
+    bench('problem_set_save', lambda: meta.save(os.path.join(directory, 'saved.yml')),
+          scale.num_questions)
+
+    def generate_exams():
+        generator = ExamGenerator(meta)
+        generator_rng = random.Random(SEED)
+        for _ in range(scale.num_exams):
+            generator.generate(exam_questions, '', rng=generator_rng)
+
+    bench('generate_exams', generate_exams, scale.num_exams)
+
+    # graded exams on disk (not timed)
+    exams_dir = os.path.join(directory, 'exams')
+    os.makedirs(exams_dir, exist_ok=True)
+    generator = ExamGenerator(meta)
+    for index in range(scale.num_exams):
+        exam = generator.generate(exam_questions, '', rng=rng)
+        answer_randomly(exam, rng)
+        exam.save(os.path.join(exams_dir, f"{index}.yml"))
+
+    def grade_exams():
+        result = CliRunner().invoke(cli.cli, ['-s', meta_path, 'grade-exams', exams_dir])
+        if result.exit_code != 0:
+            raise RuntimeError(f"grade-exams failed: {result.output}") from result.exception
+
+    bench('grade_exams', grade_exams, scale.num_exams)
+
+    def load_exams():
+        for name in os.listdir(exams_dir):
+            cli.load_exam(os.path.join(exams_dir, name))
+
+    bench('load_exams', load_exams, scale.num_exams)
+
+    # the work done by `ExamApp.grade`, and by a single changed answer
+    exam = generator.generate(exam_questions, '', rng=rng)
+    answer_randomly(exam, rng)
+    score = ExamScore(exam, meta)
+
+    def ui_grade():
+        score.clear()
+        return score.total
+
+    def ui_regrade_answer():
+        question = exam.questions[0]
+        question.answers[0].is_selected = not question.answers[0].is_selected
+        score.update(question)
+        return score.total
+
+    bench('ui_grade', ui_grade, exam_questions)
+    bench('ui_regrade_answer', ui_regrade_answer, 1)
+    return results
+
+
+def compare(current: Dict[str, object], baseline: Dict[str, object],
+            threshold: float) -> List[str]:
+    """
+    Compares the best times of two benchmark reports
+    Returns
+        Names of the benchmarks that became slower than `threshold` times the baseline
+    """
+    slower = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name, None)
+        if base is None or not base['min']:
+            continue
+        ratio = result['min'] / base['min']
+        flag = 'SLOWER' if ratio > threshold else ''
+        click.echo(f"{name:<24} {base['min'] * 1000:>10.2f}ms {result['min'] * 1000:>10.2f}ms "
+                   f"{ratio:>6.2f}x {flag}")
+        if ratio > threshold:
+            slower.append(name)
+    return slower
+
+
+def over_budget(results: Dict[str, Dict[str, float]]) -> List[str]:
+    """Returns the names of the benchmarks whose best time exceeds their budget"""
+    return [name for name, result in results.items()
+            if result.get('budget', None) is not None and result['min'] > result['budget']]
+
+
+@click.command()
+@click.option('--scale', '-s', default='small', type=click.Choice(list(SCALES.keys())))
+@click.option('--repeat', '-r', default=3, type=click.IntRange(min=1))
+@click.option('--only', multiple=True, help='Run only the named benchmark(s)')
+@click.option('--out', '-o', default=None, type=click.Path(dir_okay=False),
+              help='Save the results as JSON')
+@click.option('--compare', '-c', 'baseline', default=None, type=click.File('r'),
+              help='Baseline JSON results; exits with 1 if anything became slower')
+@click.option('--threshold', '-t', default=THRESHOLD, type=click.FloatRange(min=1),
+              help='Slowdown ratio reported as a regression')
+def main(scale, repeat, only, out, baseline, threshold):
+    """Benchmarks start-up, generation, grading, parsing and UI regrading"""
+    directory = tempfile.mkdtemp(prefix='exams-bench-')
+    try:
+        results = run_benchmarks(SCALES[scale], repeat, directory, list(only))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'scale': scale,
+        'workload': SCALES[scale]._asdict(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results
+    }
+    for name, result in results.items():
+        click.echo(f"{name:<24} {result['min'] * 1000:>10.2f}ms (median "
+                   f"{result['median'] * 1000:.2f}ms, {result['items']} items)")
+    if out:
+        with open(out, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    failed = False
+    over = over_budget(results)
+    if over:
+        click.echo(f"Over budget: {', '.join(over)}")
+        failed = True
+    if baseline:
+        baseline = json.load(baseline)
+        if baseline.get('scale', None) != scale:
+            raise click.ClickException(f"The baseline was measured at scale "
+                                       f"`{baseline.get('scale', None)}`")
+        click.echo()
+        slower = compare(report, baseline, threshold)
+        if slower:
+            click.echo(f"Slower than {threshold}x the baseline: {', '.join(slower)}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
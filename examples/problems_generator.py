@@ -4,15 +4,15 @@ from graders import GRADERS
 import random
 
 
-def generate_question(name: str, num_answers: int, points) -> dict:
-    multiple = random.choice([True, False])
+def generate_question(name: str, num_answers: int, points, rng=random) -> dict:
+    multiple = rng.choice([True, False])
     correct_answers = 1
     if multiple:
-        correct_answers = random.randint(2, num_answers - 1)
+        correct_answers = rng.randint(2, num_answers - 1)
     return {
         'is_multiple_choice': multiple,
-        'grader': random.choice(list(GRADERS.keys())),
-        'points': random.randint(points[0], points[1]),
+        'grader': rng.choice(list(GRADERS.keys())),
+        'points': rng.randint(points[0], points[1]),
         'num_answers': num_answers,
         'num_correct_answers': correct_answers,
         'text': name
@@ -27,13 +27,15 @@ def generate_answers(question: ExamQuestionMeta, num: int):
         question.insert_answer(is_correct=is_correct, text=text)
 
 
-def generate(title, num_questions: int, num_answers: int, points=(1, 5)) -> ProblemSet:
+def generate(title, num_questions: int, num_answers: int, points=(1, 5),
+             rng=random) -> ProblemSet:
     problems = ProblemSet(title=title)
     for index in range(0, num_questions):
-        kwargs = generate_question(f"Question #{index}", num_answers, points)
+        kwargs = generate_question(f"Question #{index}", num_answers, points, rng)
         question = problems.insert_question(False, str(index), **kwargs)
         generate_answers(question, num_answers)
     return problems
 
 
-generate("Test problem set", 12, 5).save('problems.yml')
+if __name__ == '__main__':
+    generate("Test problem set", 12, 5).save('problems.yml')
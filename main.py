@@ -7,6 +7,7 @@ root_dir = os.path.join(os.path.dirname(__file__), 'src')
 sys.path.insert(0, os.path.abspath(root_dir))
 
 # start the command line (allowing EXAM-prefixed env vars)
-from cli import cli
+if __name__ == '__main__':
+    from cli import cli
 
-cli(auto_envvar_prefix='EXAM')
+    cli(auto_envvar_prefix='EXAM')
@@ -0,0 +1,169 @@
+# item analysis of graded exams (difficulty, discrimination, reliability and distractors)
+from typing import Dict, List, Optional
+import numpy as np
+from batch import BatchResult, BatchGrader
+
+QUARTILE = 0.25
+"""float: share of exams in the top and bottom groups of the distractor analysis"""
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    """Values rounded for reports; None where undefined"""
+    return [round(float(value), 4) if np.isfinite(value) else None for value in values]
+
+
+def _ratio(numerators: np.ndarray, denominators: np.ndarray) -> List[Optional[float]]:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _rounded(numerators / denominators)
+
+
+class ItemAnalysis:
+    """
+    Collects BatchResults of exams graded against the same answer key and
+    computes a classical item analysis of all of them at once.
+
+    Only the compact arrays of the results are kept; every statistic is
+    computed from them with a constant number of vectorized passes.
+    """
+
+    def __init__(self, batch_grader: BatchGrader):
+        self.grader = batch_grader
+        self.batches: List[BatchResult] = []
+
+        # column -> answer id / question index (see `compact.AnswerColumns`)
+        self.column_answer = batch_grader.columns.column_answer
+        self.column_question = batch_grader.columns.column_question
+
+    def add(self, batch: BatchResult):
+        if len(batch.scores):
+            self.batches.append(batch)
+
+    @property
+    def num_exams(self) -> int:
+        return sum(len(batch.scores) for batch in self.batches)
+
+    def _concatenate(self):
+        # joins the batches, shifting their row and exam indexes
+        row_offset, exam_offset = 0, 0
+        parts = {name: [] for name in ('row_question', 'row_points', 'row_scores', 'row_exam',
+                                       'entry_row', 'entry_col', 'entry_selected',
+                                       'scores', 'max_scores')}
+        for batch in self.batches:
+            num_rows = len(batch.row_question)
+            parts['row_question'].append(batch.row_question)
+            parts['row_points'].append(batch.row_points)
+            parts['row_scores'].append(batch.row_scores)
+            parts['row_exam'].append(exam_offset + np.repeat(np.arange(len(batch.scores)),
+                                                             np.diff(batch.offsets)))
+            parts['entry_row'].append(row_offset + batch.entry_row)
+            parts['entry_col'].append(batch.entry_col)
+            parts['entry_selected'].append(batch.entry_selected)
+            parts['scores'].append(batch.scores)
+            parts['max_scores'].append(batch.max_scores)
+            row_offset += num_rows
+            exam_offset += len(batch.scores)
+        return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+    def report(self) -> Dict[str, object]:
+        """
+        Returns the analysis as a JSON-compatible dictionary:
+
+        - per question: `difficulty` (share of points earned) and `discrimination`
+          (point-biserial correlation of the question score with the rest of the exam)
+        - per answer: selection rates overall and in the top/bottom quartile of exams
+        - `cronbach_alpha` of the whole exam; with randomized question sets,
+          the item variance sum is estimated from the average item variance
+        """
+        num_questions = len(self.grader.question_ids)
+        num_columns = len(self.column_answer)
+        report = {'exams': self.num_exams, 'cronbach_alpha': None, 'questions': []}
+        if not self.batches:
+            return report
+        data = self._concatenate()
+
+        question, exam = data['row_question'], data['row_exam']
+        item = data['row_scores'].astype(float)
+        rest = data['scores'][exam] - item  # exam score without the question itself
+
+        def per_question(values):
+            return np.bincount(question, weights=values, minlength=num_questions)
+
+        # point-biserial (Pearson) correlation from per-question sums
+        count = per_question(None)
+        sum_item, sum_rest = per_question(item), per_question(rest)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_item, mean_rest = sum_item / count, sum_rest / count
+            var_item = np.maximum(per_question(item * item) / count - mean_item ** 2, 0)
+            var_rest = np.maximum(per_question(rest * rest) / count - mean_rest ** 2, 0)
+            covariance = per_question(item * rest) / count - mean_item * mean_rest
+            discrimination = covariance / np.sqrt(var_item * var_rest)
+        difficulty = _ratio(sum_item, per_question(data['row_points'].astype(float)))
+        discrimination = _rounded(discrimination)
+
+        # Cronbach's alpha; k is the average number of questions per exam
+        scores = data['scores'].astype(float)
+        k = len(question) / len(scores)
+        present = count > 0
+        mean_item_variance = np.average(var_item[present], weights=count[present])
+        total_variance = scores.var()
+        if k > 1 and total_variance > 0:
+            alpha = k / (k - 1) * (1 - k * mean_item_variance / total_variance)
+            report['cronbach_alpha'] = round(float(alpha), 4)
+
+        # selection rates by the top and bottom quartiles of exam percentages
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent = np.where(data['max_scores'] > 0, scores / data['max_scores'], 0)
+        low, high = np.quantile(percent, [QUARTILE, 1 - QUARTILE])
+        known = data['entry_col'] >= 0
+        column = data['entry_col'][known]
+        selected = data['entry_selected'][known].astype(float)
+        entry_exam = exam[data['entry_row'][known]]
+
+        def per_column(values=None, mask=None):
+            if mask is not None:
+                return np.bincount(column[mask], weights=None if values is None else
+                                   values[mask], minlength=num_columns)
+            return np.bincount(column, weights=values, minlength=num_columns)
+
+        top, bottom = percent[entry_exam] >= high, percent[entry_exam] <= low
+        presented = per_column()
+        rates = _ratio(per_column(selected), presented)
+        top_rates = _ratio(per_column(selected, top), per_column(mask=top))
+        bottom_rates = _ratio(per_column(selected, bottom), per_column(mask=bottom))
+
+        answers = [[] for _ in range(num_questions)]
+        for col in range(num_columns):
+            index = self.column_question[col]
+            answers[index].append({
+                'id': self.column_answer[col],
+                'is_correct': bool(self.grader.correct[col]),
+                'presented': int(presented[col]),
+                'selection_rate': rates[col],
+                'top_rate': top_rates[col],
+                'bottom_rate': bottom_rates[col]
+            })
+
+        for index, qid in enumerate(self.grader.question_ids):
+            report['questions'].append({
+                'id': qid,
+                'presented': int(count[index]),
+                'difficulty': difficulty[index],
+                'discrimination': discrimination[index],
+                'answers': answers[index]
+            })
+        return report
+
+
+CSV_COLUMNS = ['question_id', 'presented', 'difficulty', 'discrimination', 'answer_id',
+               'is_correct', 'answer_presented', 'selection_rate', 'top_rate', 'bottom_rate']
+"""List[str]: columns of `report_rows`; one row per answer"""
+
+
+def report_rows(report: Dict[str, object]):
+    """Flattens a `ItemAnalysis.report` into CSV rows"""
+    for question in report['questions']:
+        for answer in question['answers']:
+            yield [question['id'], question['presented'], question['difficulty'],
+                   question['discrimination'], answer['id'], answer['is_correct'],
+                   answer['presented'], answer['selection_rate'], answer['top_rate'],
+                   answer['bottom_rate']]
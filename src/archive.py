@@ -0,0 +1,66 @@
+# reading exam files straight from zip and tar archives, without extracting them
+from typing import Iterator, NamedTuple, Optional
+import os
+import tarfile
+import zipfile
+import zlib
+from watch import is_exam_file
+
+
+class ArchiveError(Exception):
+    """Raised for archives that can't be read"""
+
+
+class ArchiveMember(NamedTuple):
+    """An exam file read into memory; picklable, so it can be handed to worker processes"""
+    name: str  # path inside the archive
+    data: bytes
+
+    def __str__(self):
+        return self.name
+
+
+def is_archive(path: str) -> bool:
+    """Checks whether `path` is a zip or a (possibly compressed) tar archive"""
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def is_exam_member(name: str) -> bool:
+    # skips hidden files and the resource forks of macOS archives
+    return is_exam_file(os.path.basename(name)) and not name.startswith('__MACOSX/')
+
+
+def count_members(path: str) -> Optional[int]:
+    """
+    Returns the number of exam files in a zip archive; None for tar archives,
+    which would have to be decompressed to count them
+    """
+    if not zipfile.is_zipfile(path):
+        return None
+    with zipfile.ZipFile(path) as archive:
+        return sum(1 for info in archive.infolist()
+                   if not info.is_dir() and is_exam_member(info.filename))
+
+
+def read_members(path: str) -> Iterator[ArchiveMember]:
+    """
+    Yields the exam files of a zip or tar archive in archive order.
+    Tar archives are read as a stream, so only the current member is kept in memory.
+
+    Raises
+        ArchiveError: if the archive is corrupted
+    """
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and is_exam_member(info.filename):
+                        yield ArchiveMember(info.filename, archive.read(info))
+            return
+
+        with tarfile.open(path, 'r|*') as archive:
+            for info in archive:
+                if info.isfile() and is_exam_member(info.name):
+                    yield ArchiveMember(info.name, archive.extractfile(info).read())
+    except (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError, OSError) as ex:
+        raise ArchiveError(f"Could not read the archive `{path}` ({ex})") from ex
@@ -0,0 +1,166 @@
+# vectorized grading of many exams against a single answer key
+from typing import List, NamedTuple
+import numpy as np
+from models import AnswerKey, Exam
+from compact import AnswerColumns, CompactExam
+import profiling
+
+BATCH_GRADERS = {'binary', 'linear'}
+"""Set[str]: graders with a vectorized implementation"""
+
+
+class BatchResult(NamedTuple):
+    """
+    Responses and scores of a batch of exams.
+
+    The responses form a sparse (exam question x answer) selection matrix:
+    every presented answer is an entry at (`entry_row`, `entry_col`),
+    where each row is a single question of a single exam and each column
+    is an answer of the compiled answer key (-1 for unknown answers).
+    """
+    offsets: np.ndarray         # exam `i` owns rows [offsets[i], offsets[i + 1])
+    row_question: np.ndarray    # answer key question index of each row
+    row_points: np.ndarray      # question points stated in the exam
+    row_scores: np.ndarray      # graded score of each row
+    entry_row: np.ndarray
+    entry_col: np.ndarray
+    entry_selected: np.ndarray
+    scores: np.ndarray          # total score of each exam
+    max_scores: np.ndarray      # maximum score of each exam
+
+    def exam_scores(self, index: int) -> List[int]:
+        """Returns per-question scores of the exam at `index`, in exam order"""
+        return self.row_scores[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+
+def _bits(data: bytes, count: int) -> np.ndarray:
+    """Unpacks the first `count` bits of a `compact.pack_bits` bit array"""
+    if not count:
+        return np.zeros(0, bool)
+    values = np.frombuffer(data, dtype=np.uint8)
+    return ((values[:, None] >> np.arange(8, dtype=np.uint8)) & 1).astype(bool).ravel()[:count]
+
+
+class BatchGrader:
+    """
+    Grades many exams created from the same problem set at once; the answer columns
+    are those of `columns` (see `compact.AnswerColumns`), so `CompactExam`s encoded
+    with the same columns are graded directly
+    """
+
+    def __init__(self, key: AnswerKey, columns: AnswerColumns = None):
+        self.key = key
+        self.columns = columns or AnswerColumns(key)
+        self.question_ids = self.columns.question_ids
+        self.question_index = self.columns.question_index
+        self.answer_columns = self.columns.answer_columns  # per question: answer id -> column
+
+        questions = list(key.questions.values())
+        for question in questions:
+            if question.grader not in BATCH_GRADERS:
+                raise NotImplementedError(f"Grader `{question.grader}` can't be vectorized")
+        correct = [answer_id in questions[index].correct_ids for index, answer_id
+                   in zip(self.columns.column_question, self.columns.column_answer)]
+
+        # trailing `False` column is shared by all unknown (-1) answers
+        self.correct = np.array(correct + [False], dtype=bool)
+        self.is_linear = np.array([q.grader == 'linear' for q in key.questions.values()],
+                                  dtype=bool)
+
+    @staticmethod
+    def supports(key: AnswerKey) -> bool:
+        """Checks whether all graders used by `key` are vectorized"""
+        return all(q.grader in BATCH_GRADERS for q in key.questions.values())
+
+    @profiling.timed('batch grade', items=lambda self, exams: len(exams))
+    def grade(self, exams: List[Exam]) -> BatchResult:
+        """
+        Grades the given exams; their compatibility must be ensured beforehand.
+        Scores are identical to `Exam.get_score`.
+        """
+        offsets = [0]
+        row_question, row_points, row_entries = [], [], []
+        entry_col, entry_selected = [], []
+        question_index, answer_columns = self.question_index, self.answer_columns
+
+        # slicing copies the underlying lists of related sequences at once,
+        # which is much faster than iterating over them
+        for exam in exams:
+            for question in exam.questions[:]:
+                index = question_index[question.id]
+                columns = answer_columns[index]
+                answers = question.answers[:]
+                row_question.append(index)
+                row_points.append(question.points)
+                row_entries.append(len(answers))
+                entry_col.extend([columns.get(answer.id, -1) for answer in answers])
+                entry_selected.extend([answer.is_selected for answer in answers])
+            offsets.append(len(row_question))
+
+        return self._score(np.array(offsets, dtype=np.int64),
+                           np.array(row_question, dtype=np.int64),
+                           np.array(row_points, dtype=np.int64),
+                           np.array(row_entries, dtype=np.int64),
+                           np.array(entry_col, dtype=np.int64),
+                           np.array(entry_selected, dtype=bool))
+
+    @profiling.timed('batch grade', items=lambda self, exams: len(exams))
+    def grade_compact(self, exams: List[CompactExam]) -> BatchResult:
+        """
+        Grades compact exams encoded with the same `AnswerColumns`; their arrays
+        are joined without visiting single answers. Scores are identical to `grade`.
+        """
+        def ints(values) -> np.ndarray:
+            # `array('i')` buffers hold C ints
+            return np.frombuffer(values, dtype=np.intc) if len(values) else np.zeros(0, np.intc)
+
+        def join(parts) -> np.ndarray:
+            parts = list(parts)
+            return np.concatenate(parts).astype(np.int64) if parts else np.zeros(0, np.int64)
+
+        offsets = np.zeros(len(exams) + 1, dtype=np.int64)
+        np.cumsum([len(exam) for exam in exams], out=offsets[1:])
+        selected = [_bits(exam.selected, len(exam.answers)) for exam in exams]
+        return self._score(offsets, join(ints(exam.questions) for exam in exams),
+                           join(ints(exam.points) for exam in exams),
+                           join(np.diff(ints(exam.offsets)) for exam in exams),
+                           join(ints(exam.answers) for exam in exams),
+                           np.concatenate(selected) if selected else np.zeros(0, bool))
+
+    def _score(self, offsets, row_question, row_points, row_entries, entry_col,
+               selected) -> BatchResult:
+        # grades the rows of a (exam question x answer) selection matrix
+        num_exams = len(offsets) - 1
+        entry_row = np.repeat(np.arange(len(row_question)), row_entries)
+        num_rows = len(row_question)
+        correct = self.correct[entry_col]
+
+        def count(values):
+            # per-row sum of the given entry values
+            return np.bincount(entry_row, weights=values, minlength=num_rows)
+
+        unknown = count(entry_col < 0) > 0
+        mismatched = count(selected != correct) > 0
+        wrong_selected = count(selected & ~correct) > 0
+        all_correct = count(correct)
+        selected_correct = count(selected & correct)
+
+        # see `binary_grader`
+        binary = np.where(unknown | mismatched, 0, row_points)
+
+        # see `linear_grader`; mirrors `percentage` to get identical rounding
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent = np.where(all_correct != 0,
+                               selected_correct / all_correct * 100, 100)
+        ratio = percent / 100.0
+        linear = np.where(unknown | wrong_selected, 0, np.floor(row_points * ratio))
+
+        row_scores = np.where(self.is_linear[row_question], linear, binary).astype(np.int64)
+
+        row_exam = np.repeat(np.arange(num_exams), np.diff(offsets))
+        scores = np.bincount(row_exam, weights=row_scores, minlength=num_exams)
+        max_scores = np.bincount(row_exam, weights=row_points, minlength=num_exams)
+
+        return BatchResult(offsets, row_question, row_points, row_scores,
+                           entry_row, entry_col, selected,
+                           scores.astype(np.int64), max_scores.astype(np.int64))
@@ -3,16 +3,29 @@ import sys
 import os
 import related
 import statistics
-from models import ProblemSet, Exam, SchemeError
-from utils import get_params, percentage, short_str
+import random
+import time
+import io
+import uuid
+import loader
+import profiling
+from multiprocessing import Pool
+from typing import Callable, NamedTuple, Tuple, Optional, Iterable, Iterator, List, Dict, Union
+from models import ProblemSet, Exam, ExamGenerator, SchemeError
+from utils import get_params, percentage, short_str, derive_seed, safe_filename, chunked
 from graders import GRADERS
-from matplotlib import pyplot as plt
-import numpy as np
+from store import ResultsStore
+from stats import StreamingSummary, RankedUser, rank_users
+from operations import read_operations, apply_operation, OperationError
+from importer import QuestionImporter, read_rows
+from compact import ExamCodec, read_exam, is_reference_exam, resolve_texts, save_exam
+from archive import ArchiveMember, ArchiveError, is_archive, count_members, read_members
 
 
 COMMANDS_WITHOUT_PROBLEM_SET = {
     'create-problem-set',
-    'open-exam'
+    'open-exam',
+    'serve'
 }  # define commands that don't require a problem set
 
 
@@ -34,25 +47,46 @@ def save_meta(obj: ProblemSet):
         click.echo(f"Problem set `{obj.title}` saved to {obj.source}")
 
 
-def load_exam(path: str) -> Exam:
+ExamSource = Union[str, ArchiveMember]
+"""type: an exam file path or an exam file read from an archive"""
+
+
+@profiling.timed('load exam')
+def load_exam(path: ExamSource, meta=None) -> Exam:
     """
-    Attempts to deserialize an Exam from the given file path
+    Attempts to deserialize an Exam (in the full or reference-only format) from
+    the given file path or archive member. Texts of reference-only exams are resolved
+    if `meta` is a ProblemSet; they aren't needed for grading.
     """
     try:
-        with open(path, 'r') as file:
-            exam = related.from_yaml(file, Exam)
-            return exam
+        if isinstance(path, ArchiveMember):
+            exam = loader.load_bytes(path.data, Exam, reader=read_exam)
+        else:
+            exam = loader.load_file(path, Exam, reader=read_exam)
     except Exception as ex:
         raise click.ClickException(f"Invalid exam file `{path}` ({ex})") from ex
+    if is_reference_exam(exam) and isinstance(meta, ProblemSet):
+        resolve_texts(exam, meta)
+    return exam
 
 
 @click.group()
 @click.option('--problem-set', '-s', metavar='PATH', required=False, type=click.Path(exists=True),
               help='Path to the problem set')
+@click.option('--cache-dir', metavar='PATH', required=False, type=click.Path(file_okay=False),
+              help='Directory for caching parsed files')
+@click.option('--profile', is_flag=True, type=click.BOOL,
+              help='Print the time spent in every stage of the command')
+@click.option('--profile-out', metavar='PATH', default=None, type=click.Path(dir_okay=False),
+              help='Also save cProfile stats of the main process (implies --profile)')
 @click.pass_context
-def cli(ctx, problem_set):
+def cli(ctx, problem_set, cache_dir, profile, profile_out):
     # Ran before any command; imports the problem set
     ctx.obj = None
+    if profile or profile_out:
+        start_profiling(ctx, profile_out)
+    if cache_dir:
+        loader.parse_cache = loader.ParseCache(cache_dir)
     if problem_set:
         try:
             meta = ProblemSet.from_file(problem_set)
@@ -65,6 +99,32 @@ def cli(ctx, problem_set):
             require_meta(ctx.obj)
 
 
+def start_profiling(ctx: click.Context, path: Optional[str]):
+    """
+    Enables the stage measurements (and cProfile, if `path` is given) until the
+    command finishes; the results are reported to stderr
+    """
+    profiler = None
+    if path:
+        import cProfile  # deferred; only needed here
+        profiler = cProfile.Profile()
+
+    def finish():
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(path)
+        for line in profiling.profiler.report():
+            click.echo(line, err=True)
+        if profiler:
+            click.echo(f"cProfile stats saved to {path}", err=True)
+        profiling.profiler = None
+
+    profiling.profiler = profiling.Profiler()
+    ctx.call_on_close(finish)
+    if profiler:
+        profiler.enable()
+
+
 @cli.command()
 @click.option('--path', '-p', prompt='Path (*.yml)', type=click.Path(), help='Export path')
 @click.option('--title', '-t', prompt=True, type=click.STRING, help='Name of the problem set')
@@ -251,25 +311,182 @@ def add_answer(meta, question_id, text, correct, likelihood, id):
     save_meta(meta)
 
 
+EXAM_FORMATS = ['full', 'refs']
+"""List[str]: exam file formats; 'refs' only references the problem set (see `compact`)"""
+
+
 @cli.command()
 @click.pass_obj
 @click.option('--title', '-t', prompt=True, type=click.STRING)
 @click.option('--description', '-d', prompt=True, type=click.STRING)
 @click.option('--num-questions', '-n', prompt=True, type=click.INT)
 @click.option('--path', '-p', prompt="Path (*.yml)", type=click.Path(dir_okay=False))
-def gen_exam(meta, title, description, num_questions, path):
+@click.option('--format', '-f', 'file_format', default='full', type=click.Choice(EXAM_FORMATS),
+              help="Exam file format; 'refs' leaves out all texts")
+def gen_exam(meta, title, description, num_questions, path, file_format):
     """
     Generates an exam file
     """
 
     try:
         exam = meta.generate_exam(num_questions, description, title)
-        exam.save(path)
+        save_exam(exam, path, file_format == 'refs')
         click.echo(f"Exam written to {path}")
     except Exception as ex:
         raise click.ClickException(f"Could not generate an exam ({ex})") from ex
 
 
+@cli.command()
+@click.pass_obj
+@click.argument('operations', default='-', type=click.File('r'))
+@click.option('--format', '-f', default=None, type=click.Choice(['jsonl', 'yaml']),
+              help='Input format (guessed from the file extension by default)')
+def batch_apply(meta, operations, format):
+    """
+    Applies a stream of operations to the problem set and saves it once.
+    Every operation is a mapping with an `op` key (`add-question`, `edit-question`,
+    `add-answer` or `edit-defaults`) and the properties of the matching command.
+    The problem set is left untouched if any of the operations fails.
+    """
+    if format is None:
+        _, extension = os.path.splitext(operations.name)
+        format = 'jsonl' if extension in ('.jsonl', '.json') else 'yaml'
+
+    count = 0
+    try:
+        for count, operation in enumerate(read_operations(operations, format), 1):
+            apply_operation(meta, operation)
+    except OperationError as ex:
+        raise click.ClickException(f"Operation #{count}: {ex}") from ex
+    except Exception as ex:
+        raise click.ClickException(f"Invalid operation stream ({ex})") from ex
+
+    click.echo(f"Applied {count} operation(s)")
+    save_meta(meta)
+
+
+@cli.command()
+@click.pass_obj
+@click.argument('rows', default='-', type=click.File('r'))
+@click.option('--format', '-f', default=None, type=click.Choice(['csv', 'jsonl']),
+              help='Input format (guessed from the file extension by default)')
+def import_questions(meta, rows, format):
+    """
+    Imports questions and answers from CSV or JSON Lines rows.
+    Every row names a `question_id`, optionally sets question properties
+    (`text`, `points`, `grader`, ...) and may add an answer
+    (`answer`, `is_correct`, `answer_likelihood`).
+    Invalid rows are reported and skipped.
+    """
+    if format is None:
+        _, extension = os.path.splitext(rows.name)
+        format = 'jsonl' if extension in ('.jsonl', '.json') else 'csv'
+
+    importer = QuestionImporter(meta)
+    number = 0
+    try:
+        for number, row in enumerate(read_rows(rows, format), 1):
+            importer.add_row(number, row)
+    except Exception as ex:
+        raise click.ClickException(f"Invalid input after row #{number} ({ex})") from ex
+
+    for number, error in importer.errors:
+        click.echo(f"Row #{number}: {error}")
+    click.echo(f"Imported {importer.num_questions} question(s) and {importer.num_answers} "
+               f"answer(s); rejected {len(importer.errors)} row(s)")
+    save_meta(meta)
+
+
+_generator_args = None
+"""Tuple[ExamGenerator, int, str, str, bool, int]: generation context of `gen_exams` workers"""
+
+
+def _init_gen_worker(profile, *args):
+    global _generator_args
+    _generator_args = args
+    profiling.profiler = profiling.Profiler() if profile else None
+
+
+def _gen_worker(entry):
+    return profiling.worker_result(generate_student_exam(*_generator_args, *entry))
+
+
+def generate_student_exam(generator: ExamGenerator, num_questions: int, description: str,
+                          title: str, reference: bool, seed: int, user_name: str,
+                          path: str) -> str:
+    """
+    Generates and saves the exam of a single student.
+    The exam only depends on the master `seed` and `user_name`.
+    """
+    rng = random.Random(derive_seed(seed, user_name))
+    exam = generator.generate(num_questions, description, title, rng)
+    exam.user_name = user_name
+    save_exam(exam, path, reference)
+    return path
+
+
+@cli.command()
+@click.pass_obj
+@click.option('--roster', '-r', required=True, type=click.File('r'),
+              help='File with one student name per line')
+@click.option('--out', '-o', required=True, type=click.Path(file_okay=False),
+              help='Output directory')
+@click.option('--title', '-t', prompt=True, type=click.STRING)
+@click.option('--description', '-d', prompt=True, type=click.STRING)
+@click.option('--num-questions', '-n', prompt=True, type=click.INT)
+@click.option('--seed', default=None, type=click.INT,
+              help='Master seed; the same seed and name reproduce the same exam')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=0),
+              help="Number of generating processes (0 = one per CPU)")
+@click.option('--format', '-f', 'file_format', default='full', type=click.Choice(EXAM_FORMATS),
+              help="Exam file format; 'refs' leaves out all texts")
+def gen_exams(meta, roster, out, title, description, num_questions, seed, jobs, file_format):
+    """
+    Generates an exam file for every student in the roster
+    """
+    names = [line.strip() for line in roster if line.strip()]
+    entries = []  # (user name, path)
+    paths = set()
+    for name in names:
+        path = os.path.join(out, safe_filename(name) + '.yml')
+        if path in paths:
+            raise click.ClickException(f"Duplicate roster entry: `{name}`")
+        paths.add(path)
+        entries.append((name, path))
+
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    click.echo(f"Master seed: {seed}")
+
+    os.makedirs(out, exist_ok=True)
+    generator = ExamGenerator(meta)
+    args = (generator, num_questions, description, title, file_format == 'refs', seed)
+    jobs = jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    try:
+        if jobs <= 1:
+            results = (generate_student_exam(*args, *entry) for entry in entries)
+            with click.progressbar(results, length=len(entries)) as bar:
+                for _ in bar:
+                    pass
+        else:
+            chunksize = max(1, min(64, len(entries) // (jobs * 4)))
+            with Pool(jobs, initializer=_init_gen_worker,
+                      initargs=(profiling.profiler is not None, *args)) as pool:
+                results = map(profiling.merge_result,
+                              pool.imap_unordered(_gen_worker, entries, chunksize))
+                with click.progressbar(results, length=len(entries)) as bar:
+                    for _ in bar:
+                        pass
+    except Exception as ex:
+        raise click.ClickException(f"Could not generate the exams ({ex})") from ex
+
+    elapsed = time.perf_counter() - start
+    rate = len(entries) / elapsed if elapsed > 0 else 0
+    click.echo(f"Generated {len(entries)} exam(s) in {out} ({elapsed:.2f}s, {rate:.1f} exams/s)")
+
+
 @cli.command()
 @click.pass_obj
 @click.argument('exam', required=True, type=click.Path(exists=True))
@@ -279,13 +496,15 @@ def open_exam(meta, exam, clear):
     Provides a GUI to interact with the exam file.
     Specify `--problem-set` to automatically grade the answers.
     """
-    exam_obj = load_exam(exam)
+    exam_obj = load_exam(exam, meta)
 
     if meta:
         try:
             meta.ensure_exam_compatibility(exam_obj)
         except SchemeError as ex:
             raise click.ClickException(f"{ex}") from ex
+    elif is_reference_exam(exam_obj):
+        raise click.ClickException("Reference-only exams need a problem set (use --problem-set)")
 
     if clear:
         exam.clear()
@@ -299,24 +518,350 @@ def open_exam(meta, exam, clear):
     app.run()
 
 
-def grade_exam(meta, path, question_callback) -> (int, int, float, str):
+@cli.command()
+@click.pass_obj
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--to', '-t', 'file_format', required=True, type=click.Choice(EXAM_FORMATS),
+              help='Target format')
+def convert_exams(meta, paths, file_format):
+    """
+    Converts exam files in-place between the full and the reference-only format.
+    Texts of the full format are taken from the problem set.
+    """
+    count = 0
+    for path in paths:
+        try:
+            exam = load_exam(path, meta)
+            meta.ensure_exam_compatibility(exam)
+            save_exam(exam, path, file_format == 'refs')
+            count += 1
+        except Exception as ex:
+            click.echo(f"{os.path.basename(path)}: {ex}")
+    click.echo(f"Converted {count} of {len(paths)} exam(s)")
+
+
+class ExamRecord(NamedTuple):
+    """Compact result of a single graded exam"""
+    user: str
+    score: int
+    max_score: int
+    questions: Tuple[str, ...]  # question ids, in exam order
+    scores: Tuple[int, ...]     # per-question scores, aligned with `questions`
+    completed_at: Optional[str] = None  # ISO 8601 completion time
+    source: str = ''            # file path or archive member name
+
+    @property
+    def recency(self) -> Tuple[str, str]:
+        """
+        Sort key of the exams of a user; every summary represents a user by their
+        latest exam: the last completed one, or the one with the greatest path if
+        the completion times are equal (or missing)
+        """
+        return self.completed_at or '', self.source
+
+
+def source_name(path: ExamSource) -> str:
+    return path.name if isinstance(path, ArchiveMember) else path
+
+
+class GradeResult(NamedTuple):
+    """Outcome of grading a single exam file; either `record` or `error` is None"""
+    record: Optional[ExamRecord]
+    error: Optional[str]
+    reason: Optional[str] = None  # why the file wasn't graded (see `SKIP_REASONS`)
+
+
+class SkippedExam(Exception):
+    """Raised for exams that aren't eligible for grading; the message is the reason"""
+
+
+SKIP_REASONS = ('not completed', 'no user name', 'other problem set')
+"""Tuple[str, ...]: reasons of (silently) skipped exams; others are reported as errors"""
+
+HEADER_KEYS = ('meta_uuid', 'was_user_completed', 'user_name')
+
+
+@profiling.timed('header scan')
+def check_exam_header(meta, path: ExamSource):
+    """
+    Rejects ineligible exams by scanning only their top-level properties
+
+    Raises
+        SkippedExam: if the exam shouldn't be graded against `meta`
+    """
+    if isinstance(path, ArchiveMember):
+        header = loader.scan_header(io.StringIO(path.data.decode('utf-8')), HEADER_KEYS)
+    else:
+        with open(path, 'r') as file:
+            header = loader.scan_header(file, HEADER_KEYS)
+    if not header:
+        return  # not a mapping; the full parse reports the error
+    if not header.get('was_user_completed', False):
+        raise SkippedExam('not completed')
+    if not header.get('user_name', None):
+        raise SkippedExam('no user name')
+    try:
+        meta_uuid = header.get('meta_uuid', None)
+        meta_uuid = uuid.UUID(meta_uuid) if meta_uuid else None
+    except (TypeError, ValueError):
+        return
+    if meta_uuid != meta.uuid:
+        raise SkippedExam('other problem set')
+
+
+def prepare_exam(meta, path: ExamSource) -> Exam:
+    """
+    Loads an exam and makes sure it can be graded against `meta`.
+    Ineligible exams are rejected before the (much slower) full parse,
+    unless the parse cache makes loading them cheap anyway
+    (archive members are never cached).
+
+    Raises
+        SkippedExam: if the exam is incomplete or belongs to another problem set
+        SchemeError: if the exam isn't compatible with `meta`
+        Exception: if the exam is invalid
+    """
+    if loader.parse_cache is None or isinstance(path, ArchiveMember):
+        check_exam_header(meta, path)
+    exam = load_exam(path)
+    if not exam.was_user_completed:
+        raise SkippedExam('not completed')
+    if not exam.user_name:
+        raise SkippedExam('no user name')
+    if exam.meta_uuid != meta.uuid:
+        raise SkippedExam('other problem set')
+    meta.ensure_exam_compatibility(exam)
+    return exam
+
+
+def completion_time(exam: Exam) -> Optional[str]:
+    return exam.completed_at.isoformat() if exam.completed_at else None
+
+
+@profiling.timed('grade exam')
+def grade_exam(meta, exam: Exam, source: str = '') -> ExamRecord:
     """
     Utility function that grades a single exam
+    """
+    scores = []
+    score = exam.get_score(meta, lambda question, points: scores.append(points))
+    questions = tuple(question.id for question in exam.questions)
+    return ExamRecord(exam.user_name, score, exam.max_score, questions, tuple(scores),
+                      completion_time(exam), source)
+
+
+def _failure(path: ExamSource, ex: Exception, reason: str) -> GradeResult:
+    return GradeResult(None, f"{os.path.basename(source_name(path))}: {ex}", reason)
+
+
+def prepare_chunk(meta, paths: List[ExamSource], convert: Callable = None) \
+        -> Tuple[List[Optional[GradeResult]], List[Tuple[int, object]]]:
+    """
+    Loads the exams of a chunk that can be graded against `meta` (see `prepare_exam`),
+    passing each one through `convert` (e.g. into a more compact form) if given
     Returns
-        A tuple of (score, max_score, percentage, user_name)
+        A failed GradeResult per rejected path (None for the others),
+        and (index, exam) pairs of the exams ready to be graded
     """
-    try:
-        exam = load_exam(path)
-        if not exam.was_user_completed:
-            raise Exception('Not completed')
-        meta.ensure_exam_compatibility(exam)
-        score = exam.get_score(meta, question_callback)
-        max_score = exam.max_score
-        percent = percentage(score, max_score)
-        return score, max_score, percent, exam.user_name
-    except Exception as ex:
-        click.echo(f"{os.path.basename(path)}: {ex}")
-    return None
+    results = [None] * len(paths)
+    pending = []
+    for index, path in enumerate(paths):
+        try:
+            exam = prepare_exam(meta, path)
+            pending.append((index, convert(exam) if convert else exam))
+        except SkippedExam as ex:
+            results[index] = _failure(path, ex, str(ex))
+        except SchemeError as ex:
+            results[index] = _failure(path, ex, 'incompatible')
+        except Exception as ex:
+            results[index] = _failure(path, ex, 'invalid')
+    return results, pending
+
+
+def grade_chunk(meta, batch_grader, paths: List[ExamSource]) -> List[GradeResult]:
+    """
+    Utility function that grades a chunk of exam files, vectorized if `batch_grader` is given
+    Returns
+        A GradeResult per path
+    """
+    results, pending = prepare_chunk(meta, paths)
+
+    if batch_grader:
+        batch = batch_grader.grade([exam for _, exam in pending])
+        for position, (index, exam) in enumerate(pending):
+            questions = tuple(question.id for question in exam.questions)
+            record = ExamRecord(exam.user_name, int(batch.scores[position]),
+                                int(batch.max_scores[position]), questions,
+                                tuple(batch.exam_scores(position)), completion_time(exam),
+                                source_name(paths[index]))
+            results[index] = GradeResult(record, None)
+    else:
+        for index, exam in pending:
+            try:
+                results[index] = GradeResult(
+                    grade_exam(meta, exam, source_name(paths[index])), None)
+            except Exception as ex:
+                results[index] = _failure(paths[index], ex, 'grading error')
+
+    return results
+
+
+GRADE_CHUNK_SIZE = 256
+"""int: maximum number of exams graded at once"""
+
+_worker_args = None
+"""Tuple[Callable, AnswerKey, BatchGrader]: grading context of `map_chunks` pool workers"""
+
+
+def _init_grade_worker(function, key, batch_grader, parse_cache, profile):
+    global _worker_args
+    _worker_args = (function, key, batch_grader)
+    loader.parse_cache = parse_cache
+    profiling.profiler = profiling.Profiler() if profile else None
+
+
+def _grade_worker(paths):
+    function, key, batch_grader = _worker_args
+    return profiling.worker_result(function(key, batch_grader, paths))
+
+
+def map_chunks(function, key, batch_grader, paths: Iterable[ExamSource], jobs: int = 1,
+               count: Optional[int] = None) -> Iterator:
+    """
+    Calls `function(key, batch_grader, chunk)` on chunks of `paths`, yielding
+    the results in input order. With `jobs` > 1, the chunks are spread over a process pool.
+    `paths` may be a lazy iterable (e.g. of archive members); `count` is their number, if known.
+    """
+    if count is None and isinstance(paths, list):
+        count = len(paths)
+    # small chunks keep the results (and the progress bar) streaming
+    size = GRADE_CHUNK_SIZE
+    if count is not None:
+        size = max(1, min(GRADE_CHUNK_SIZE, -(-count // (jobs * 4))))
+    chunks = chunked(paths, size)
+
+    if jobs <= 1:
+        for chunk in chunks:
+            yield function(key, batch_grader, chunk)
+        return
+
+    profile = profiling.profiler is not None
+    with Pool(jobs, initializer=_init_grade_worker,
+              initargs=(function, key, batch_grader, loader.parse_cache, profile)) as pool:
+        yield from map(profiling.merge_result, pool.imap(_grade_worker, chunks))
+
+
+def grade_files(meta, paths: Iterable[ExamSource], jobs: int = 1,
+                count: Optional[int] = None) -> Iterator[GradeResult]:
+    """
+    Grades the given exam files, yielding a GradeResult per file in input order.
+    Exams are graded in vectorized chunks whenever the graders allow it.
+    With `jobs` > 1, the chunks (of paths or in-memory archive members) are spread
+    over a process pool; see `map_chunks`.
+    """
+    from batch import BatchGrader  # deferred; imports numpy
+
+    key = meta.compile()
+    batch_grader = BatchGrader(key) if BatchGrader.supports(key) else None
+    for results in map_chunks(grade_chunk, key, batch_grader, paths, jobs, count):
+        yield from results
+
+
+def list_exams(path: str) -> Tuple[Iterable[ExamSource], Optional[int]]:
+    """
+    Returns the exam files of a directory (as paths) or of a zip/tar archive
+    (as ArchiveMembers, read lazily), along with their number if it's known upfront
+    """
+    if os.path.isdir(path):
+        with profiling.stage('list files'):
+            paths = [os.path.join(path, file) for file in os.listdir(path)]
+        return paths, len(paths)
+    if not is_archive(path):
+        raise click.BadParameter(f"`{path}` is neither a directory nor a zip/tar archive",
+                                 param_hint='DIRECTORY')
+    return read_members(path), count_members(path)
+
+
+def analyze_chunk(key, batch_grader, paths: List[ExamSource]):
+    """
+    Utility function that batch-grades the eligible exams of a chunk; the exams are
+    kept as `CompactExam`s (sharing the columns of `batch_grader`) once loaded
+    Returns
+        The BatchResult of the graded exams and the GradeResults of the rejected files
+    """
+    codec = ExamCodec(key, batch_grader.columns)
+    results, pending = prepare_chunk(key, paths, codec.encode)
+    batch = batch_grader.grade_compact([exam for _, exam in pending])
+    return batch, [result for result in results if result is not None]
+
+
+def count_failure(not_graded: Dict[str, int], result: GradeResult, err: bool = False):
+    """
+    Counts a file that wasn't graded by its reason; errors other than
+    the `SKIP_REASONS` are printed
+    """
+    not_graded[result.reason] = not_graded.get(result.reason, 0) + 1
+    if result.reason not in SKIP_REASONS:
+        click.echo(result.error, err=err)
+
+
+def report_not_graded(not_graded: Dict[str, int], err: bool = False):
+    """Prints the number of files that weren't graded, per reason"""
+    if not_graded:
+        counts = ', '.join(f"{reason}: {count}" for reason, count
+                           in sorted(not_graded.items(), key=lambda item: -item[1]))
+        click.echo(f"Skipped {sum(not_graded.values())} file(s) ({counts})", err=err)
+
+
+class GradingSummary:
+    """
+    Folds exam records into per-user and per-question stats;
+    users are represented by their latest exam (see `ExamRecord.recency`)
+    """
+
+    def __init__(self):
+        self.user_scores = dict()     # user -> (score, max_score, percentage)
+        self.question_stats = dict()  # question id -> {score: occurrences}
+        self.max_score = 0
+        self._recency = dict()        # user -> recency of the exam in `user_scores`
+
+    def add(self, record: ExamRecord):
+        recency = record.recency
+        if self._recency.get(record.user, recency) <= recency:
+            percent = percentage(record.score, record.max_score)
+            self.user_scores[record.user] = (record.score, record.max_score, percent)
+            self._recency[record.user] = recency
+        # get max score so far
+        self.max_score = max(self.max_score, record.max_score)
+
+        for qid, score in zip(record.questions, record.scores):
+            counts = self.question_stats.setdefault(qid, dict())
+            counts[score] = counts.get(score, 0) + 1  # +1 occurrence
+
+    def ranked_users(self, limit: Optional[int] = None) -> List[RankedUser]:
+        """See `rank_users`"""
+        return rank_users(self.user_scores, limit)
+
+    def scores(self) -> List[int]:
+        return [score for score, *_ in self.user_scores.values()]
+
+    def score_histogram(self) -> Dict[int, int]:
+        """user score -> occurrences"""
+        histogram = dict()
+        for score, *_ in self.user_scores.values():
+            histogram[score] = histogram.get(score, 0) + 1
+        return histogram
+
+    def general_stats(self) -> Tuple[int, float, float]:
+        """
+        Returns (count, mean, median) of user scores
+        """
+        scores = self.scores()
+        return len(scores), statistics.mean(scores), statistics.median(scores)
+
+    def stdev(self) -> float:
+        """Population standard deviation of user scores"""
+        return statistics.pstdev(self.scores())
 
 
 def format_score(score, max_score) -> str:
@@ -324,14 +869,10 @@ def format_score(score, max_score) -> str:
     return f"{score:.1f} / {max_score:.1f} ({percent:.1f}%)"
 
 
-def display_user_stats(user_scores):
-    # order by score percentage
+def display_user_stats(ranked_users: List[RankedUser]):
+    # rows are ordered by score percentage (see `rank_users`)
     click.echo("Per-user score stats:")
-    scores = user_scores.items()
-    # user, (score, max_score, percentage) -> x[1][2]
-    ordered = sorted(scores, key=lambda x: x[1][2], reverse=True)
-
-    for i, (user, pair) in enumerate(ordered):
+    for i, (user, pair) in enumerate(ranked_users):
         click.echo(f"{i + 1}. {user}: {format_score(pair[0], pair[1])}")
     click.echo()
 
@@ -354,63 +895,345 @@ def display_question_stats(meta, question_stats):
     click.echo()
 
 
-def display_plot(scores, max_score):
-    stats = plt.hist(scores, label='Exam scores', range=(0, max_score))
-    plt.xlabel('Combined score')
-    plt.ylabel('Participants')
-    plt.xticks(stats[1])  # sets the histogram bin intervals as X-axis labels
-    plt.yticks(np.arange(0, len(scores), 1.0))
-    plt.title('Exam scores')
+def draw_histogram(axes, histogram, max_score):
+    """
+    Draws a histogram of user scores on matplotlib axes
+
+    Args
+        histogram: score -> number of users
+    """
+    from matplotlib.ticker import MaxNLocator
+
+    # weighting avoids materializing every single score
+    scores = list(histogram.keys())
+    counts = list(histogram.values())
+    _, edges, _ = axes.hist(scores, weights=counts, label='Exam scores', range=(0, max_score))
+    axes.set_xlabel('Combined score')
+    axes.set_ylabel('Participants')
+    axes.set_xticks(edges)  # sets the histogram bin intervals as X-axis labels
+    # a few integer ticks, however many participants there are
+    axes.yaxis.set_major_locator(MaxNLocator(integer=True))
+    axes.set_title('Exam scores')
+
+
+def has_display() -> bool:
+    if sys.platform.startswith('linux'):
+        return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return True
+
+
+def display_plot(histogram, max_score):
+    if not has_display():
+        click.echo("No display available; showing a text histogram instead")
+        display_score_histogram(histogram, max_score)
+        return
+
+    # deferred; matplotlib dominates the start-up time of every other command
+    from matplotlib import pyplot as plt
+
+    _, axes = plt.subplots()
+    draw_histogram(axes, histogram, max_score)
     plt.show()
 
 
-def display_general_stats(scores, max_score, plot=False):
-    click.echo(f"Number of participants: {len(scores)}")
-    mean = statistics.mean(scores)
+def save_plot(histogram, max_score, path: str):
+    """
+    Renders the score histogram into a file without a display; the format is
+    chosen by the extension (e.g. PNG or SVG). '.txt' files get a text histogram,
+    which doesn't need matplotlib at all.
+    """
+    if os.path.splitext(path)[1].lower() == '.txt':
+        with open(path, 'w') as file:
+            display_score_histogram(histogram, max_score, file=file)
+        return
+
+    # renders through the non-interactive Agg canvas (which hands other formats
+    # over to their own canvases), without loading pyplot or any GUI toolkit;
+    # matplotlib < 3.1 can't save figures without a canvas
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    draw_histogram(figure.subplots(), histogram, max_score)
+    figure.savefig(path)
+
+
+def display_general_stats(summary, plot=False):
+    max_score = summary.max_score
+    count, mean, median = summary.general_stats()
+    click.echo(f"Number of participants: {count}")
     click.echo(f"Mean score: {format_score(mean, max_score)}")
-    median = statistics.median(scores)
     click.echo(f"Median score: {format_score(median, max_score)}")
+    click.echo(f"Standard deviation: {summary.stdev():.1f}")
     # show the plot
     if plot:
-        display_plot(scores, max_score)
+        display_plot(summary.score_histogram(), max_score)
+
+
+def display_score_histogram(histogram, max_score, bins=10, width=40, file=None):
+    """
+    Prints a text histogram of user scores
+
+    Args
+        histogram: score -> number of users
+        file: output stream (stdout by default)
+    """
+    bins = max(1, min(bins, max_score + 1))
+    counts = [0] * bins
+    for score, count in histogram.items():
+        index = score * bins // (max_score + 1) if max_score > 0 else 0
+        counts[min(max(index, 0), bins - 1)] += count
+    largest = max(counts) or 1
+    click.echo("Score histogram:", file=file)
+    for index, count in enumerate(counts):
+        low = -(-index * (max_score + 1) // bins)
+        high = -(-(index + 1) * (max_score + 1) // bins) - 1
+        bar = '#' * round(count * width / largest)
+        click.echo(f"{low:>5}-{high:<5}| {bar} {count}", file=file)
+    click.echo(file=file)
+
+
+def display_live_stats(meta, summary, display_questions):
+    click.clear()
+    click.echo(f"[{time.strftime('%H:%M:%S')}] {len(summary.records)} graded exam(s)")
+    click.echo()
+    if not summary.ranked_users(1):
+        click.echo('No valid exams found')
+        return
+    if display_questions:
+        display_question_stats(meta, summary.question_stats)
+    display_user_stats(summary.ranked_users())
+    display_score_histogram(summary.score_histogram(), summary.max_score)
+    display_general_stats(summary)
+
+
+WATCH_SETTLE_TIME = 0.05
+"""float: seconds to wait for more file events before regrading"""
+
+
+def watch_exams(meta, key, directory, display_questions, jobs):
+    """
+    Grades the directory once, then regrades only the files that change
+    """
+    from batch import BatchGrader  # deferred; imports numpy
+    from watch import LiveSummary, watch_directory, is_exam_file
+
+    summary = LiveSummary()
+    watcher = watch_directory(directory)
+    try:
+        # start watching first, so no file gets lost between grading and watching
+        paths = [os.path.join(directory, file) for file in os.listdir(directory)
+                 if is_exam_file(file)]
+        for path, result in zip(paths, grade_files(key, paths, jobs)):
+            summary.update(path, result.record)
+        display_live_stats(meta, summary, display_questions)
+
+        batch_grader = BatchGrader(key) if BatchGrader.supports(key) else None
+        while True:
+            changed = watcher.wait()
+            # a burst of saves (e.g. a whole class submitting) is graded together
+            changed |= watcher.wait(WATCH_SETTLE_TIME)
+            existing = sorted(path for path in changed if os.path.isfile(path))
+            for path in changed.difference(existing):
+                summary.update(path, None)
+            for path, result in zip(existing, grade_chunk(key, batch_grader, existing)):
+                summary.update(path, result.record)
+            display_live_stats(meta, summary, display_questions)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def collect_grades(key, summary, paths: Iterable[ExamSource], count: Optional[int], jobs: int,
+                   stored: bool = False):
+    """
+    Grades the exam files into `summary` (a ResultsStore if `stored`), showing a progress bar
+    and reporting the files that weren't graded
+    """
+    not_graded = dict()  # reason -> number of files
+    results = grade_files(key, paths, jobs, count)
+    try:
+        with click.progressbar(results, length=count) as results:
+            for index, result in enumerate(results):
+                if result.error:
+                    count_failure(not_graded, result)
+                if stored:
+                    summary.add(paths[index], result.record, result.error)
+                elif result.record:
+                    summary.add(result.record)
+    except ArchiveError as ex:
+        raise click.ClickException(str(ex)) from ex
+    report_not_graded(not_graded)
+
+
+def display_summary(meta, summary, display_questions, text_histogram, plot, plot_out):
+    if not summary.ranked_users(1):
+        click.echo('No valid exams found')
+        return
+
+    with profiling.stage('stats output'):
+        if display_questions:
+            display_question_stats(meta, summary.question_stats)
+        display_user_stats(summary.ranked_users())
+        if text_histogram:
+            display_score_histogram(summary.score_histogram(), summary.max_score)
+        display_general_stats(summary, plot)
+        if plot_out:
+            save_plot(summary.score_histogram(), summary.max_score, plot_out)
+            click.echo(f"Plot saved to {plot_out}")
 
 
 @cli.command()
 @click.pass_obj
-@click.argument('directory', type=click.Path(exists=True, file_okay=False, dir_okay=True))
+@click.argument('directory', type=click.Path(exists=True))
 @click.option('--plot', '-p', is_flag=True, type=click.BOOL, help="Plot scores using matplotlib")
+@click.option('--plot-out', metavar='FILE', default=None, type=click.Path(dir_okay=False),
+              help="Save the score plot to FILE (.png, .svg, ...; .txt for a text histogram)")
+@click.option('--histogram', 'text_histogram', is_flag=True, type=click.BOOL,
+              help="Print a text histogram of scores")
 @click.option('--display-questions', '-q', is_flag=True, type=click.BOOL,
               help="Display question stats")
-def grade_exams(meta, directory, plot, display_questions):
-    """Grades all exams in the given directory"""
-    user_scores = dict()     # stores user scores
-    question_stats = dict()  # counts scores per-question
-    max_score = 0
-
-    def on_question(question, score):
-        # handle a graded question
-        nonlocal question_stats
-        qid = question.id
-        map = question_stats.get(qid, dict())
-        map[score] = map.get(score, 0) + 1  # +1 occurrence
-        question_stats[qid] = map
-
-    # grade all files in the folder; show a progress bar
-    with click.progressbar(os.listdir(directory)) as files:
-        for file in files:
-            path = os.path.join(directory, file)
-            output = grade_exam(meta, path, on_question)
-            if output:
-                *stats, user = output
-                user_scores[user] = stats
-                # get max score so far
-                max_score = max(max_score, stats[1])
-
-    if len(user_scores) == 0:
-        click.echo('No valid exams found')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=0),
+              help="Number of grading processes (0 = one per CPU)")
+@click.option('--store', metavar='PATH', default=None, type=click.Path(dir_okay=False),
+              help="SQLite results store; only new or changed files are graded")
+@click.option('--watch', '-w', is_flag=True, type=click.BOOL,
+              help="Keep running; regrade files as they change and refresh the stats")
+@click.option('--top', metavar='K', default=None, type=click.IntRange(min=1),
+              help="Only rank the best K exams; stats then take constant memory, "
+                   "counting every exam file separately")
+def grade_exams(meta, directory, plot, plot_out, text_histogram, display_questions, jobs,
+                store, watch, top):
+    """
+    Grades all exams in the given directory, or in a zip/tar archive
+    (its files are read into memory, without extracting them)
+    """
+    key = meta.compile()
+    if (watch or store) and not os.path.isdir(directory):
+        raise click.BadParameter("--watch and --store need a directory", param_hint='DIRECTORY')
+    jobs = jobs or os.cpu_count() or 1
+    if watch:
+        watch_exams(meta, key, directory, display_questions, jobs)
+        return
+    if store and top:
+        raise click.BadOptionUsage('top', "--top can't be combined with --store")
+
+    paths, count = list_exams(directory)
+    if store:
+        with ResultsStore(store, key) as summary:
+            paths = summary.sync(paths)
+            collect_grades(key, summary, paths, len(paths), jobs, stored=True)
+            summary.commit()
+            display_summary(meta, summary, display_questions, text_histogram, plot, plot_out)
         return
 
-    if display_questions:
-        display_question_stats(meta, question_stats)
-    display_user_stats(user_scores)
-    display_general_stats([score for score, *_ in user_scores.values()], max_score, plot)
+    summary = StreamingSummary(top) if top else GradingSummary()
+    collect_grades(key, summary, paths, count, jobs)
+    display_summary(meta, summary, display_questions, text_histogram, plot, plot_out)
+
+
+@cli.command()
+@click.pass_obj
+@click.argument('directory', type=click.Path(exists=True))
+@click.option('--format', '-f', 'output_format', default='json', type=click.Choice(['json', 'csv']),
+              help='Report format')
+@click.option('--out', '-o', default='-', type=click.File('w'), help='Report path')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=0),
+              help="Number of grading processes (0 = one per CPU)")
+def analyze_items(meta, directory, output_format, out, jobs):
+    """
+    Reports question difficulty, discrimination, Cronbach's alpha and
+    per-answer selection rates by the top and bottom quartiles of exams
+    in a directory or a zip/tar archive. CSV reports have one row per answer.
+    """
+    import json
+    import csv
+    from batch import BatchGrader  # deferred; imports numpy
+    from analysis import ItemAnalysis, CSV_COLUMNS, report_rows
+
+    key = meta.compile()
+    if not BatchGrader.supports(key):
+        raise click.ClickException("Item analysis only supports the binary and linear graders")
+    batch_grader = BatchGrader(key)
+    analysis = ItemAnalysis(batch_grader)
+    paths, count = list_exams(directory)
+    jobs = jobs or os.cpu_count() or 1
+
+    # the report may go to stdout, so everything else goes to stderr
+    not_graded = dict()  # reason -> number of files
+    try:
+        for batch, failures in map_chunks(analyze_chunk, key, batch_grader, paths, jobs, count):
+            analysis.add(batch)
+            for result in failures:
+                count_failure(not_graded, result, err=True)
+    except ArchiveError as ex:
+        raise click.ClickException(str(ex)) from ex
+    report_not_graded(not_graded, err=True)
+    with profiling.stage('item analysis'):
+        report = analysis.report()
+
+    if output_format == 'json':
+        json.dump(report, out, indent=2)
+        out.write('\n')
+    else:
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(report_rows(report))
+    click.echo(f"Analyzed {report['exams']} exam(s); "
+               f"Cronbach's alpha: {report['cronbach_alpha']}", err=True)
+
+
+@cli.command()
+@click.pass_obj
+@click.argument('problem_sets', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--host', default='127.0.0.1', type=click.STRING, help='Interface to listen on')
+@click.option('--port', '-p', default=8080, type=click.IntRange(0, 65535))
+@click.option('--socket', 'unix_socket', metavar='PATH', default=None,
+              type=click.Path(dir_okay=False), help='Listen on a Unix socket instead')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=0),
+              help="Number of grading processes (0 = one per CPU)")
+def serve(meta, problem_sets, host, port, unix_socket, jobs):
+    """
+    Grades and generates exams over HTTP, keeping the problem sets in memory.
+    Serves `--problem-set` and any PROBLEM_SETS given as arguments;
+    exams are graded against the problem set they were created from.
+    """
+    import asyncio
+    from server import GradingService
+
+    loaded = [meta] if meta else []
+    for path in problem_sets:
+        try:
+            loaded.append(ProblemSet.from_file(path))
+        except Exception as ex:
+            raise click.ClickException(f"Invalid problem set `{path}` ({ex})") from ex
+    if not loaded:
+        require_meta(None)
+    uuids = [str(problems.uuid) for problems in loaded]
+    if len(set(uuids)) != len(uuids):
+        raise click.ClickException("The problem sets must have distinct UUIDs")
+
+    service = GradingService(loaded, jobs or os.cpu_count() or 1)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = None
+    try:
+        server = loop.run_until_complete(service.start(host, port, unix_socket))
+        address = unix_socket or '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+        click.echo(f"Serving {len(loaded)} problem set(s) on {address} (Ctrl+C to stop)")
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    except OSError as ex:
+        raise click.ClickException(f"Could not listen ({ex})") from ex
+    finally:
+        if server:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            if unix_socket and os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+        loop.close()
+        asyncio.set_event_loop(None)
+        service.close()
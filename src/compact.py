@@ -0,0 +1,341 @@
+# memory-efficient representations of exams created from a single problem set,
+# and compact, text-free exam files that reference it
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+import sys
+import attr
+import related
+import yaml
+from graders import get_grader
+from loader import YAML_LOADER
+from models import Exam, ExamQuestion, ExamQuestionAnswer, ProblemSet, SchemeError
+from utils import atomic_write
+import profiling
+
+
+class _FlowList(list):
+    """List written on a single line by `ReferenceDumper`"""
+
+
+class ReferenceDumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    pass
+
+
+ReferenceDumper.add_representer(
+    _FlowList, lambda dumper, data: dumper.represent_sequence(
+        'tag:yaml.org,2002:seq', data, flow_style=True))
+
+
+def pack_bits(values: List[bool]) -> bytes:
+    """Packs booleans into a bit array (least significant bit first)"""
+    if not values:
+        return b''
+    # the first value becomes the lowest bit of a (little endian) integer
+    number = int(''.join(['1' if value else '0' for value in reversed(values)]), 2)
+    return number.to_bytes((len(values) + 7) // 8, 'little')
+
+
+def get_bit(bits: bytes, index: int) -> bool:
+    return bool(bits[index >> 3] & (1 << (index & 7)))
+
+
+class AnswerColumns:
+    """
+    Interns the questions and answers of an answer key: question ids become
+    indexes into `question_ids`, and every answer gets a column of its own.
+    Shared by `ExamCodec` and `batch.BatchGrader`, so compact exams can be
+    graded without translating their columns.
+    """
+
+    def __init__(self, meta):
+        self.key = meta.compile()  # a ProblemSet or an AnswerKey
+        self.question_ids = list(self.key.questions.keys())
+        self.question_index = {qid: index for index, qid in enumerate(self.question_ids)}
+
+        self.answer_columns = []  # per question: answer id -> column
+        self.column_question = []  # column -> question index
+        self.column_answer = []  # column -> answer id
+        for index, question in enumerate(self.key.questions.values()):
+            columns = dict()
+            for answer_id in sorted(question.answer_ids):
+                columns[answer_id] = len(self.column_answer)
+                self.column_question.append(index)
+                self.column_answer.append(answer_id)
+            self.answer_columns.append(columns)
+
+    @property
+    def num_columns(self) -> int:
+        return len(self.column_answer)
+
+    def answer_column(self, question_id: str, answer_id: int) -> int:
+        """
+        Returns the column of an answer
+
+        Raises
+            SchemeError: if the answer key doesn't contain the answer
+        """
+        index = self.question_index.get(question_id, None)
+        if index is None:
+            raise SchemeError(f"missing question: {question_id}")
+        column = self.answer_columns[index].get(answer_id, None)
+        if column is None:
+            raise SchemeError(f"missing answer {answer_id} of question {question_id}")
+        return column
+
+
+class CompactExam:
+    """
+    Exam whose questions and answers are stored as indexes into `AnswerColumns`.
+    No text is kept: it is looked up in the problem set when decoding.
+    """
+    __slots__ = ('meta_uuid', 'generated_at', 'title', 'description', 'was_user_completed',
+                 'user_name', 'completed_at', 'questions', 'points', 'multiple_choice',
+                 'offsets', 'answers', 'selected')
+
+    def __init__(self, meta_uuid, generated_at, title, description, was_user_completed,
+                 user_name, completed_at, questions: array, points: array,
+                 multiple_choice: bytes, offsets: array, answers: array, selected: bytes):
+        self.meta_uuid = meta_uuid
+        self.generated_at = generated_at
+        self.title = title
+        self.description = description
+        self.was_user_completed = was_user_completed
+        self.user_name = user_name
+        self.completed_at = completed_at
+        self.questions = questions  # question index of each question
+        self.points = points  # points of each question
+        self.multiple_choice = multiple_choice  # bit per question
+        self.offsets = offsets  # question `i` owns answers [offsets[i], offsets[i + 1])
+        self.answers = answers  # answer column of each presented answer
+        self.selected = selected  # bit per presented answer
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    @property
+    def max_score(self) -> int:
+        return sum(self.points)
+
+    def question_answers(self, index: int) -> Iterator[Tuple[int, bool]]:
+        """Yields (answer column, is selected) of the question at `index`"""
+        selected = self.selected
+        for entry in range(self.offsets[index], self.offsets[index + 1]):
+            yield self.answers[entry], get_bit(selected, entry)
+
+
+class _AnswerView(NamedTuple):
+    id: int
+    is_selected: bool
+
+
+class _QuestionView(NamedTuple):
+    id: str
+    points: int
+    answers: List[_AnswerView]
+
+
+class ExamCodec:
+    """
+    Converts exams created from `meta` (a ProblemSet or an AnswerKey) to and from
+    `CompactExam`s. Decoded exams only get texts if `meta` is a ProblemSet.
+    The codec doesn't follow later changes to the problem set.
+    """
+
+    def __init__(self, meta, columns: AnswerColumns = None):
+        self.meta = meta
+        self.columns = columns or AnswerColumns(meta)
+        self.key = self.columns.key
+
+    def encode(self, exam: Exam) -> CompactExam:
+        """
+        Builds the compact representation of an exam created from the problem set
+
+        Raises
+            SchemeError: if the exam contains questions or answers unknown to the problem set
+        """
+        questions, points, offsets, answers = array('i'), array('i'), array('i', [0]), array('i')
+        multiple_choice, selected = [], []
+        question_index, answer_columns = self.columns.question_index, self.columns.answer_columns
+        # see `BatchGrader.grade` on slicing related sequences
+        for question in exam.questions[:]:
+            index = question_index.get(question.id, None)
+            if index is None:
+                raise SchemeError(f"missing question: {question.id}")
+            columns = answer_columns[index]
+            questions.append(index)
+            points.append(question.points)
+            multiple_choice.append(question.is_multiple_choice)
+            question_answers = question.answers[:]
+            try:
+                answers.extend([columns[answer.id] for answer in question_answers])
+            except KeyError as ex:
+                raise SchemeError(f"missing answer {ex.args[0]} of question {question.id}") \
+                    from None
+            selected.extend([answer.is_selected for answer in question_answers])
+            offsets.append(len(answers))
+
+        # share strings and uuids that repeat across the exams of a problem set
+        meta_uuid = self.key.uuid if exam.meta_uuid == self.key.uuid else exam.meta_uuid
+        title = sys.intern(exam.title) if exam.title else exam.title
+        description = sys.intern(exam.description) if exam.description else exam.description
+        return CompactExam(meta_uuid, exam.generated_at, title, description,
+                           exam.was_user_completed, exam.user_name, exam.completed_at,
+                           questions, points, pack_bits(multiple_choice),
+                           offsets, answers, pack_bits(selected))
+
+    def decode(self, compact: CompactExam) -> Exam:
+        """
+        Rebuilds the `Exam`; question and answer texts come from the problem set
+        """
+        columns = self.columns
+        texts = isinstance(self.meta, ProblemSet)
+        questions = []
+        for position, index in enumerate(compact.questions):
+            qid = columns.question_ids[index]
+            question_meta = self.meta.questions[qid] if texts else None
+            answer_texts = {answer.id: answer.text for answer in question_meta.answers} \
+                if texts else dict()
+            answers = []
+            for column, is_selected in compact.question_answers(position):
+                answer_id = columns.column_answer[column]
+                answers.append(ExamQuestionAnswer(id=answer_id,
+                                                  text=answer_texts.get(answer_id, ''),
+                                                  is_selected=is_selected))
+            questions.append(ExamQuestion(id=qid, text=question_meta.text if texts else '',
+                                          is_multiple_choice=get_bit(compact.multiple_choice,
+                                                                     position),
+                                          answers=answers, points=compact.points[position]))
+        return Exam(meta_uuid=compact.meta_uuid, generated_at=compact.generated_at,
+                    questions=questions, title=compact.title, description=compact.description,
+                    was_user_completed=compact.was_user_completed,
+                    user_name=compact.user_name, completed_at=compact.completed_at)
+
+    def question_scores(self, compact: CompactExam) -> List[int]:
+        """
+        Grades every question of a compact exam; scores are identical to `Exam.get_score`
+        """
+        columns = self.columns
+        scores = []
+        for position, index in enumerate(compact.questions):
+            key = self.key.questions[columns.question_ids[index]]
+            answers = [_AnswerView(columns.column_answer[column], is_selected)
+                       for column, is_selected in compact.question_answers(position)]
+            question = _QuestionView(key.id, compact.points[position], answers)
+            scores.append(get_grader(key.grader)(key, question))
+        return scores
+
+    def get_score(self, compact: CompactExam) -> int:
+        return sum(self.question_scores(compact))
+
+
+# reference-only exam files: question and answer ids plus selection bits, without any text
+REFERENCE_FORMAT = 'exam-refs'
+REFERENCE_VERSION = 1
+"""int: version of the reference-only format written by `to_reference_data`"""
+
+
+def is_reference_exam(exam: Exam) -> bool:
+    """Checks whether the exam was loaded from a reference-only file"""
+    return getattr(exam, 'is_reference', False)
+
+
+def to_reference_data(exam: Exam) -> Dict[str, object]:
+    """
+    Returns the reference-only representation of an exam; every question becomes
+    `[id, points, is_multiple_choice, [answer ids], selection bits]`
+    """
+    # serialize the scalar properties exactly like the full format does
+    data = related.to_dict(attr.evolve(exam, questions=[]))
+    data.pop('questions', None)
+
+    questions = []
+    for question in exam.questions[:]:
+        answers = question.answers[:]
+        bits = ''.join('1' if answer.is_selected else '0' for answer in answers)
+        questions.append(_FlowList([question.id, question.points, question.is_multiple_choice,
+                                    [answer.id for answer in answers], bits]))
+    return {'format': REFERENCE_FORMAT, 'version': REFERENCE_VERSION, **data,
+            'questions': questions}
+
+
+def from_reference_data(data: Dict[str, object]) -> Exam:
+    """
+    Builds an exam from its reference-only representation; texts are left empty
+    (see `resolve_texts`)
+
+    Raises
+        SchemeError: if the data uses an unsupported format version
+    """
+    data = dict(data)
+    if data.pop('format', None) != REFERENCE_FORMAT:
+        raise SchemeError("not a reference-only exam")
+    version = data.pop('version', None)
+    if not isinstance(version, int) or version > REFERENCE_VERSION:
+        raise SchemeError(f"unsupported reference-only exam version: {version}")
+
+    questions = []
+    for qid, points, multiple_choice, answer_ids, bits in data.pop('questions', None) or []:
+        if len(bits) != len(answer_ids):
+            raise SchemeError(f"question {qid}: expected {len(answer_ids)} selection bits")
+        answers = [ExamQuestionAnswer(id=answer_id, is_selected=bit == '1')
+                   for answer_id, bit in zip(answer_ids, bits)]
+        questions.append(ExamQuestion(id=str(qid), is_multiple_choice=multiple_choice,
+                                      answers=answers, points=points))
+    exam = Exam(questions=questions, **data)
+    exam.is_reference = True
+    return exam
+
+
+def exam_from_data(data: Dict[str, object], cls=Exam) -> Exam:
+    """
+    Builds an exam from a deserialized mapping in either the full or the reference-only format
+    """
+    if 'format' in data:
+        return from_reference_data(data)
+    return cls(**data)
+
+
+def read_exam(stream, cls=Exam) -> Exam:
+    """
+    Deserializes an exam in either the full or the reference-only format
+    (usable as the `reader` of `loader.load_file`)
+    """
+    return exam_from_data(related.from_yaml(stream, loader_cls=YAML_LOADER), cls)
+
+
+def resolve_texts(exam: Exam, meta: ProblemSet):
+    """
+    Fills in question and answer texts of a reference-only exam from the problem set;
+    unknown questions and answers are left without text
+    """
+    for question in exam.questions[:]:
+        question_meta = meta.find_question(question.id)
+        if question_meta is None:
+            continue
+        question.text = question_meta.text
+        texts = {answer.id: answer.text for answer in question_meta.answers}
+        for answer in question.answers[:]:
+            answer.text = texts.get(answer.id, '')
+
+
+def write_exam(exam: Exam, stream, reference: bool = None):
+    """
+    Writes an exam to a text stream in the full or reference-only format;
+    by default, the format it was loaded in is kept
+    """
+    if reference is None:
+        reference = is_reference_exam(exam)
+    if not reference:
+        related.to_yaml(exam, stream)
+        return
+    data = to_reference_data(exam)
+    yaml.dump(data, stream, Dumper=ReferenceDumper, default_flow_style=False, sort_keys=False)
+
+
+@profiling.timed('save exam')
+def save_exam(exam: Exam, path: str, reference: bool = None):
+    """
+    Saves an exam in the full or reference-only format; see `write_exam`
+    """
+    with atomic_write(path) as file:
+        write_exam(exam, file, reference)
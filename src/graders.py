@@ -8,12 +8,13 @@ def binary_grader(question_meta, question) -> int:
     Basic question grader that grants all the points
     only if all answers are correct
     """
-    if question_meta.id != question.id:
+    key = question_meta.compile()
+    if key.id != question.id:
         return 0
 
     for answer in question.answers:
-        meta = question_meta.find_answer(answer.id)
-        if not meta or answer.is_selected != meta.is_correct:
+        if answer.id not in key.answer_ids \
+                or answer.is_selected != (answer.id in key.correct_ids):
             return 0
 
     return question.points
@@ -25,15 +26,18 @@ def linear_grader(question_meta, question) -> int:
     to the number of correct answers.
     The score is set to zero if a wrong answer was selected
     """
-    if question_meta.id != question.id:
+    key = question_meta.compile()
+    if key.id != question.id:
         return 0
     correct_answers = 0
     all_correct_answers = 0
     for answer in question.answers:
-        meta = question_meta.find_answer(answer.id)
-        if not meta or (answer.is_selected and not meta.is_correct):
+        if answer.id not in key.answer_ids:
             return 0
-        if meta.is_correct:
+        is_correct = answer.id in key.correct_ids
+        if answer.is_selected and not is_correct:
+            return 0
+        if is_correct:
             all_correct_answers += 1
             if answer.is_selected:
                 correct_answers += 1
@@ -43,6 +47,7 @@ def linear_grader(question_meta, question) -> int:
     return math.floor(question.points * ratio)
 
 
+# graders accept either an ExamQuestionMeta or its CompiledQuestion
 GRADERS = {
     'binary': binary_grader,
     'linear': linear_grader
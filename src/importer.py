@@ -0,0 +1,142 @@
+# bulk import of questions and answers from CSV or JSON Lines rows
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
+import csv
+import json
+from models import ExamQuestionAnswerMeta
+from operations import QUESTION_FIELDS, OperationError, get_fields
+
+ANSWER_COLUMNS = {
+    'answer': ('text', str),
+    'is_correct': ('is_correct', bool),
+    'answer_likelihood': ('likelihood', int)
+}
+"""Dict[str, Tuple[str, type]]: row columns describing an answer -> (answer property, type)"""
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+class InvalidRow(NamedTuple):
+    """A row that couldn't be decoded; rejected by `QuestionImporter.add_row`"""
+    error: str
+
+
+def read_rows(stream, format: str) -> Iterator[Union[Dict[str, object], InvalidRow]]:
+    """
+    Lazily reads rows from a CSV file with a header ('csv') or from JSON Lines ('jsonl').
+    Empty CSV cells are skipped; malformed JSON lines become InvalidRows.
+    """
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value not in ('', None)}
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as ex:
+                    yield InvalidRow(f"invalid JSON ({ex})")
+
+
+def convert(name: str, value, expected: type):
+    """
+    Converts CSV strings to the `expected` type; other values are checked as-is
+    """
+    if isinstance(value, str) and expected is not str:
+        text = value.strip().lower()
+        if expected is bool and text in TRUE_VALUES | FALSE_VALUES:
+            return text in TRUE_VALUES
+        if expected is int:
+            try:
+                return int(text)
+            except ValueError:
+                pass
+        raise OperationError(f"`{name}` should be of type {expected.__name__}")
+    if value is not None and expected is not str and not isinstance(value, expected):
+        raise OperationError(f"`{name}` should be of type {expected.__name__}")
+    if expected is str and value is not None and not isinstance(value, str):
+        value = str(value)
+    return value
+
+
+class QuestionImporter:
+    """
+    Builds questions and answers from flat rows; every row names a `question_id`
+    and may set question properties and/or add an answer (`answer`, `is_correct`,
+    `answer_likelihood`). JSON rows may also hold a list of `answers` mappings.
+    Invalid rows are rejected without affecting the problem set.
+    """
+
+    def __init__(self, meta):
+        self.meta = meta
+        self.next_answer_ids = dict()  # question id -> next free answer id
+        self.num_questions = 0
+        self.num_answers = 0
+        self.errors: List[Tuple[int, str]] = []  # (row number, message)
+
+    def _next_answer_id(self, id: str, question) -> int:
+        next_id = self.next_answer_ids.get(id, None)
+        if next_id is None:
+            # computed once per question; every new answer then takes O(1)
+            next_id = max((ans.id for ans in question.answers), default=0) + 1
+        self.next_answer_ids[id] = next_id + 1
+        return next_id
+
+    def _parse_answer(self, values: Dict[str, object]) -> Dict[str, object]:
+        answer = dict()
+        for column, (name, expected) in ANSWER_COLUMNS.items():
+            if values.get(column, None) is not None:
+                answer[name] = convert(column, values[column], expected)
+        if 'text' not in answer:
+            raise OperationError("answers need a text")
+        return answer
+
+    def add_row(self, number: int, row: Dict[str, object]) -> bool:
+        """
+        Imports a single row; returns False (and records the error) if it's invalid
+        """
+        try:
+            self._add_row(row)
+            return True
+        except OperationError as ex:
+            self.errors.append((number, str(ex)))
+            return False
+
+    def _add_row(self, row: Dict[str, object]):
+        if isinstance(row, InvalidRow):
+            raise OperationError(row.error)
+        if not isinstance(row, dict):
+            raise OperationError("rows should be mappings")
+        row = dict(row)
+        id = row.pop('question_id', None)
+        if id is None:
+            raise OperationError("missing `question_id`")
+        id = str(id)
+
+        # validate the whole row before touching the problem set
+        answers = row.pop('answers', None) or []
+        if not isinstance(answers, list) or not all(isinstance(values, dict)
+                                                    for values in answers):
+            raise OperationError("`answers` should be a list of mappings")
+        answers = [self._parse_answer(values) for values in answers]
+        if any(column in row for column in ANSWER_COLUMNS):
+            answers.append(self._parse_answer(row))
+        for column in ANSWER_COLUMNS:
+            row.pop(column, None)
+        properties = {name: convert(name, value, QUESTION_FIELDS.get(name, str))
+                      for name, value in row.items()}
+        properties = get_fields(properties, QUESTION_FIELDS, ())
+
+        question = self.meta.find_question(id)
+        if question is None:
+            question = self.meta.insert_question(False, id, **properties)
+            question.id = id
+            self.num_questions += 1
+        elif properties:
+            question = self.meta.insert_question(True, id, **properties)
+            question.id = id
+
+        for answer in answers:
+            answer_id = self._next_answer_id(id, question)
+            question.answers.append(ExamQuestionAnswerMeta(id=answer_id, **answer))
+            self.num_answers += 1
@@ -0,0 +1,159 @@
+# fast YAML deserialization helpers
+from typing import Callable, Dict, Iterable, Optional
+import hashlib
+import io
+import os
+import pickle
+import related
+import yaml
+import profiling
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+"""type: the fastest available safe YAML loader (libyaml-based, if PyYAML was built with it);
+files never need Python tags, and loading untrusted exams must not run code"""
+
+
+def from_yaml(stream, cls):
+    """
+    Deserializes an object of type `cls` from a YAML stream
+    """
+    return related.from_yaml(stream, cls, loader_cls=YAML_LOADER)
+
+
+YAML_NULLS = {'', '~', 'null', 'Null', 'NULL'}
+YAML_BOOLEANS = {
+    **dict.fromkeys(['true', 'True', 'TRUE', 'yes', 'Yes', 'YES', 'on', 'On', 'ON'], True),
+    **dict.fromkeys(['false', 'False', 'FALSE', 'no', 'No', 'NO', 'off', 'Off', 'OFF'], False)
+}
+"""Dict[str, bool]: plain YAML 1.1 scalars that resolve to booleans; like PyYAML,
+only these exact spellings (e.g. `tRuE` stays a string)"""
+
+
+def _scalar_value(event):
+    if event.style:
+        return event.value  # quoted strings are never resolved
+    if event.value in YAML_NULLS:
+        return None
+    return YAML_BOOLEANS.get(event.value, event.value)
+
+
+def scan_header(stream, keys: Iterable[str]) -> Dict[str, object]:
+    """
+    Reads top-level scalars of a YAML mapping from the event stream, without
+    constructing the document. Nested values are skipped, and parsing stops
+    as soon as all `keys` were found.
+
+    Returns
+        The found values: None, booleans or strings (numbers aren't resolved)
+    """
+    keys = set(keys)
+    values = dict()
+    depth = 0
+    key = None  # top-level key whose value comes next
+    for event in yaml.parse(stream, Loader=YAML_LOADER):
+        kind = type(event)
+        if kind is yaml.ScalarEvent or kind is yaml.AliasEvent:
+            if depth != 1:
+                continue
+            if key is None:
+                key = getattr(event, 'value', '')
+                continue
+            if key in keys and kind is yaml.ScalarEvent:
+                values[key] = _scalar_value(event)
+                if len(values) == len(keys):
+                    break
+            key = None
+        elif kind is yaml.MappingStartEvent or kind is yaml.SequenceStartEvent:
+            if depth == 0 and kind is not yaml.MappingStartEvent:
+                break  # not a mapping
+            depth += 1
+            key = None  # nested values are skipped
+        elif kind is yaml.MappingEndEvent or kind is yaml.SequenceEndEvent:
+            depth -= 1
+            if depth == 0:
+                break
+    return values
+
+
+class ParseCache:
+    """
+    On-disk cache of deserialized (and validated) objects.
+    Entries are keyed by the source path, modification time and size.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, path: str, cls) -> str:
+        name = f"{cls.__module__}.{cls.__qualname__}:{os.path.abspath(path)}"
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def load(self, path: str, cls, parse: Callable[[str], object]):
+        """
+        Returns the cached object for `path`; calls `parse(path)` on a cache miss
+        """
+        stat = os.stat(path)
+        key = (self.VERSION, stat.st_mtime_ns, stat.st_size)
+        entry_path = self._entry_path(path, cls)
+
+        try:
+            with open(entry_path, 'rb') as file:
+                entry_key, obj = pickle.load(file)
+            if entry_key == key:
+                return obj
+        except Exception:
+            pass  # missing or corrupted entry
+
+        obj = parse(path)
+
+        # write to a temporary file first so readers never see partial entries
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                pickle.dump((key, obj), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            pass  # caching is best-effort
+        return obj
+
+
+parse_cache: Optional[ParseCache] = None
+"""ParseCache: the cache used by `load_file`; disabled if None"""
+
+
+@profiling.timed('parse yaml', size=lambda path, *args: os.path.getsize(path))
+def _parse_file(path: str, cls, prepare: Optional[Callable], reader: Callable):
+    with open(path, 'r') as file:
+        obj = reader(file, cls)
+    if prepare:
+        prepare(obj)
+    return obj
+
+
+@profiling.timed('parse yaml', size=lambda data, *args, **kwargs: len(data))
+def load_bytes(data: bytes, cls, prepare: Callable = None, reader: Callable = from_yaml):
+    """
+    Deserializes an object of type `cls` from an in-memory YAML file; see `load_file`.
+    The result is never cached.
+    """
+    obj = reader(io.StringIO(data.decode('utf-8')), cls)
+    if prepare:
+        prepare(obj)
+    return obj
+
+
+def load_file(path: str, cls, prepare: Callable = None, reader: Callable = from_yaml):
+    """
+    Deserializes an object of type `cls` from a YAML file, using `parse_cache` if enabled
+
+    Args
+        prepare: called with the deserialized object before it's cached
+        reader: deserializes the object from a stream, called as `reader(stream, cls)`
+    """
+    if parse_cache:
+        return parse_cache.load(path, cls, lambda path: _parse_file(path, cls, prepare, reader))
+    return _parse_file(path, cls, prepare, reader)
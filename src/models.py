@@ -1,10 +1,12 @@
-from typing import List, Optional, Dict, Callable
+from typing import List, Optional, Dict, Callable, FrozenSet, NamedTuple, Tuple
 import related
 from datetime import datetime
 import random
+import loader
+import profiling
 from config import ConfigProvider
 from graders import get_grader
-from utils import combine_dictionaries, weighted_random
+from utils import combine_dictionaries, WeightedSampler, atomic_write
 
 
 class ConfigError(Exception):
@@ -12,7 +14,9 @@ class ConfigError(Exception):
 
 
 class SchemeError(Exception):
-    pass
+    def __init__(self, message: str, mismatches: Tuple['Mismatch', ...] = ()):
+        super().__init__(message)
+        self.mismatches = tuple(mismatches)
 
 
 CFG = ConfigProvider.get_question_defaults()
@@ -34,6 +38,18 @@ class ExamQuestionAnswerMeta:
         return f"{self.id}: [{'+' if self.is_correct else '-'}] {self.text}"
 
 
+class CompiledQuestion(NamedTuple):
+    """Immutable grading view of an ExamQuestionMeta"""
+    id: str
+    points: int
+    grader: str
+    answer_ids: FrozenSet[int]
+    correct_ids: FrozenSet[int]
+
+    def compile(self) -> 'CompiledQuestion':
+        return self
+
+
 @related.mutable
 class ExamQuestionAnswer:
     id = related.IntegerField(0)
@@ -66,16 +82,18 @@ class ExamQuestionMeta:
     answers = related.SequenceField(ExamQuestionAnswerMeta, required=False)
     grader = related.StringField('binary', required=False)
 
-    def prepare_answers(self) -> List[ExamQuestionAnswerMeta]:
+    def answer_samplers(self) -> Tuple[WeightedSampler, WeightedSampler]:
         """
-        Returns a list with randomly selected answers
+        Returns reusable samplers of correct and wrong answers
+
+        Raises
+            SchemeError: if there aren't enough answers to pick from
         """
         correct_answers = list(filter(lambda ans: ans.is_correct, self.answers))
         wrong_answers = list(filter(lambda ans: not ans.is_correct, self.answers))
         wrong_answers_count = self.num_answers - self.num_correct_answers
 
         def validate(items, count, prompt):
-            nonlocal self
             item_count = len(items)
             if count > item_count:
                 raise SchemeError(
@@ -87,11 +105,27 @@ class ExamQuestionMeta:
         def get_likelihood(ans):
             return ans.likelihood
 
-        correct_answers = weighted_random(correct_answers, get_likelihood, self.num_correct_answers)
-        wrong_answers = weighted_random(wrong_answers, get_likelihood, wrong_answers_count)
+        return (WeightedSampler(correct_answers, get_likelihood),
+                WeightedSampler(wrong_answers, get_likelihood))
+
+    def prepare_answers(self, rng=random,
+                        samplers: Tuple[WeightedSampler, WeightedSampler] = None) \
+            -> List[ExamQuestionAnswerMeta]:
+        """
+        Returns a list with randomly selected answers
+
+        Args
+            rng: source of randomness (e.g. a seeded `random.Random`)
+            samplers: precomputed `answer_samplers`
+        """
+        correct_sampler, wrong_sampler = samplers or self.answer_samplers()
+        wrong_answers_count = self.num_answers - self.num_correct_answers
+
+        correct_answers = correct_sampler.sample(self.num_correct_answers, rng)
+        wrong_answers = wrong_sampler.sample(wrong_answers_count, rng)
 
         answers = correct_answers + wrong_answers
-        random.shuffle(answers)
+        rng.shuffle(answers)
         return answers
 
     def _get_next_answer_id(self) -> int:
@@ -123,6 +157,18 @@ class ExamQuestionMeta:
 
         return new_answer
 
+    def compile(self, id: str = None) -> CompiledQuestion:
+        """
+        Returns an immutable grading view of this question
+
+        Args
+            id: overrides the question id (e.g. with its problem set key)
+        """
+        answer_ids = frozenset(ans.id for ans in self.answers)
+        correct_ids = frozenset(ans.id for ans in self.answers if ans.is_correct)
+        return CompiledQuestion(id if id is not None else self.id, self.points, self.grader,
+                                answer_ids, correct_ids)
+
     def validate(self):
         """Validates object state"""
         for answer in self.answers:
@@ -142,10 +188,11 @@ class ExamQuestion:
     points = related.IntegerField(0)
 
     @staticmethod
-    def from_meta(id: str, meta: ExamQuestionMeta):
+    def from_meta(id: str, meta: ExamQuestionMeta, rng=random,
+                  samplers: Tuple[WeightedSampler, WeightedSampler] = None):
         meta.validate()
         multiple_choice = meta.is_multiple_choice
-        answers_meta = meta.prepare_answers()
+        answers_meta = meta.prepare_answers(rng, samplers)
         answers = [ExamQuestionAnswer.from_meta(ans) for ans in answers_meta]
         return ExamQuestion(id=id, text=meta.text, is_multiple_choice=multiple_choice,
                             answers=answers,
@@ -174,7 +221,7 @@ class Exam:
     completed_at = related.DateTimeField(required=False)
 
     def save(self, path: str):
-        with open(path, "w") as file:
+        with atomic_write(path) as file:
             related.to_yaml(self, file)
 
     def clear(self):
@@ -192,11 +239,13 @@ class Exam:
     def max_score(self):
         return sum(q.points for q in self.questions)
 
+    @profiling.timed('score exam')
     def get_score(self, meta, question_callback: Callable = None) -> int:
         """
         Calculates this Exam's total score.
 
         Args
+            meta: the ProblemSet (or its compiled AnswerKey) to grade against
             question_callback: called for each graded question with its score
         """
         if meta is None:
@@ -245,21 +294,17 @@ class ProblemSet:
         """
         return self.questions.get(id, None)
 
-    def generate_exam(self, num_questions: int, description: str, title: str = None) -> Exam:
+    def generate_exam(self, num_questions: int, description: str, title: str = None,
+                      rng=random) -> Exam:
         """
         Creates an Exam instance from randomly selected questions and answers
         Args:
             num_questions: the number of questions to include
             description: exam description shown to user
             title: short exam title
+            rng: source of randomness (e.g. a seeded `random.Random`)
         """
-        questions_meta = weighted_random(self.questions.items(), lambda q: q[1].likelihood,
-                                         num_questions)
-        questions = [ExamQuestion.from_meta(id, meta) for id, meta in questions_meta]
-        now = datetime.now()
-        return Exam(meta_uuid=self.uuid, generated_at=now, title=title or self.title,
-                    questions=questions,
-                    description=description)
+        return ExamGenerator(self).generate(num_questions, description, title, rng)
 
     def ensure_exam_compatibility(self, exam: Exam) -> None:
         """
@@ -268,25 +313,23 @@ class ProblemSet:
         Raises
             SchemeError: if the `exam` isn't compatible
         """
+        check_exam_compatibility(self, exam)
 
-        def fail(reason):
-            raise SchemeError(
-                f"Problem set `{self.title}` does not match the exam `{self.title}` ({reason})")
-
-        if self.uuid != exam.meta_uuid:
-            fail('UUID')
-
-        # check for missing questions
-        for question in exam.questions:
-            if self.find_question(question.id) is None:
-                fail(f"missing question: {question.id}")
+    def compile(self) -> 'AnswerKey':
+        """
+        Builds an immutable answer key for grading.
+        The key doesn't follow later changes to this problem set.
+        """
+        questions = {qid: question.compile(qid) for qid, question in self.questions.items()}
+        return AnswerKey(self.uuid, self.title, questions)
 
+    @profiling.timed('save problem set')
     def save(self, path: str) -> None:
         """
         Saves this object instance as YAML to the specified path
         """
         self.validate()
-        with open(path, "w") as file:
+        with atomic_write(path) as file:
             related.to_yaml(self, file, suppress_empty_values=True, suppress_map_key_values=True)
 
     def validate(self):
@@ -295,8 +338,153 @@ class ProblemSet:
             question.validate()
 
     @staticmethod
+    @profiling.timed('load problem set')
     def from_file(path: str):
-        with open(path, "r") as file:
-            obj = related.from_yaml(file, ProblemSet)
-            obj.validate()
-            return obj
+        return loader.load_file(path, ProblemSet, ProblemSet.validate)
+
+
+class ExamGenerator:
+    """
+    Generates exams from a problem set, reusing its weight tables between exams.
+    The generator doesn't follow later changes to the problem set.
+    """
+
+    def __init__(self, meta: ProblemSet):
+        self.meta = meta
+        self.question_sampler = WeightedSampler(meta.questions.items(),
+                                                lambda q: q[1].likelihood)
+        self.answer_samplers = dict()  # question id -> samplers (built on first use)
+
+    def _get_answer_samplers(self, id: str, question: ExamQuestionMeta):
+        samplers = self.answer_samplers.get(id, None)
+        if samplers is None:
+            question.validate()
+            samplers = question.answer_samplers()
+            self.answer_samplers[id] = samplers
+        return samplers
+
+    @profiling.timed('generate exam')
+    def generate(self, num_questions: int, description: str, title: str = None,
+                 rng=random) -> Exam:
+        """
+        Creates an Exam instance; see `ProblemSet.generate_exam`
+        """
+        meta = self.meta
+        questions_meta = self.question_sampler.sample(num_questions, rng)
+        questions = [ExamQuestion.from_meta(id, question, rng,
+                                            self._get_answer_samplers(id, question))
+                     for id, question in questions_meta]
+        now = datetime.now()
+        return Exam(meta_uuid=meta.uuid, generated_at=now, title=title or meta.title,
+                    questions=questions,
+                    description=description)
+
+
+class AnswerKey(NamedTuple):
+    """Immutable grading view of a ProblemSet (see `ProblemSet.compile`)"""
+    uuid: object
+    title: str
+    questions: Dict[str, CompiledQuestion]
+
+    def find_question(self, id: str) -> CompiledQuestion:
+        """
+        Returns the question with specified `id` if it exists; otherwise None
+        """
+        return self.questions.get(id, None)
+
+    def ensure_exam_compatibility(self, exam: Exam) -> None:
+        """
+        Checks whether the `exam` was created from the compiled problem set.
+
+        Raises
+            SchemeError: if the `exam` isn't compatible
+        """
+        check_exam_compatibility(self, exam)
+
+    def compile(self) -> 'AnswerKey':
+        return self
+
+
+class Mismatch(NamedTuple):
+    """A difference between an exam and the problem set it should be created from"""
+    kind: str  # one of `MISMATCH_KINDS`
+    question_id: Optional[str] = None
+    answer_id: Optional[int] = None
+    expected: object = None
+    actual: object = None
+
+    def __str__(self):
+        if self.kind == 'uuid':
+            return 'UUID'
+        if self.kind == 'points':
+            return (f"points of question {self.question_id}: "
+                    f"expected {self.expected}, found {self.actual}")
+        if self.answer_id is not None:
+            return f"{self.kind}: {self.answer_id} of question {self.question_id}"
+        return f"{self.kind}: {self.question_id}"
+
+
+MISMATCH_KINDS = ('uuid', 'missing question', 'duplicate question', 'points',
+                  'missing answer', 'duplicate answer')
+
+MAX_REPORTED_MISMATCHES = 5
+"""int: mismatches listed in the message of a SchemeError; all of them are attached to it"""
+
+
+def find_exam_mismatches(meta, exam: Exam) -> List[Mismatch]:
+    """
+    Compares the `exam` with `meta` (a ProblemSet or an AnswerKey) in a single pass.
+    An AnswerKey already holds the id sets of all questions, so the cost is linear
+    in the size of the exam; the questions of a ProblemSet are compiled on the fly.
+
+    Returns
+        All mismatches, in exam order
+    """
+    mismatches = []
+    if meta.uuid != exam.meta_uuid:
+        mismatches.append(Mismatch('uuid', expected=meta.uuid, actual=exam.meta_uuid))
+
+    question_ids = set()
+    # see `BatchGrader.grade` on slicing related sequences
+    for question in exam.questions[:]:
+        qid = question.id
+        if qid in question_ids:
+            mismatches.append(Mismatch('duplicate question', qid))
+            continue
+        question_ids.add(qid)
+        key = meta.find_question(qid)
+        if key is None:
+            mismatches.append(Mismatch('missing question', qid))
+            continue
+        key = key.compile()
+        if question.points != key.points:
+            mismatches.append(Mismatch('points', qid, expected=key.points,
+                                       actual=question.points))
+
+        answer_ids = set()
+        for answer in question.answers[:]:
+            if answer.id in answer_ids:
+                mismatches.append(Mismatch('duplicate answer', qid, answer.id))
+            elif answer.id not in key.answer_ids:
+                mismatches.append(Mismatch('missing answer', qid, answer.id))
+            answer_ids.add(answer.id)
+    return mismatches
+
+
+@profiling.timed('compatibility')
+def check_exam_compatibility(meta, exam: Exam) -> None:
+    """
+    Checks whether the `exam` was created from `meta` (a ProblemSet or an AnswerKey);
+    see `find_exam_mismatches`
+
+    Raises
+        SchemeError: if the `exam` isn't compatible; lists all the mismatches
+    """
+    mismatches = find_exam_mismatches(meta, exam)
+    if not mismatches:
+        return
+    reasons = '; '.join(str(mismatch) for mismatch in mismatches[:MAX_REPORTED_MISMATCHES])
+    if len(mismatches) > MAX_REPORTED_MISMATCHES:
+        reasons += f"; {len(mismatches) - MAX_REPORTED_MISMATCHES} more"
+    raise SchemeError(f"Problem set `{meta.title}` does not match the exam `{exam.title}` "
+                      f"({reasons})", mismatches)
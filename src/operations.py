@@ -0,0 +1,133 @@
+# problem set mutations applied in bulk (see `batch-apply`)
+from typing import Dict, Iterator
+import json
+import yaml
+from graders import GRADERS
+
+QUESTION_FIELDS = {
+    'text': str,
+    'num_answers': int,
+    'num_correct_answers': int,
+    'points': int,
+    'grader': str,
+    'likelihood': int,
+    'is_multiple_choice': bool
+}
+"""Dict[str, type]: question properties that can be set by operations"""
+
+ANSWER_FIELDS = {
+    'text': str,
+    'is_correct': bool,
+    'likelihood': int,
+    'id': int
+}
+"""Dict[str, type]: answer properties that can be set by operations"""
+
+
+class OperationError(Exception):
+    pass
+
+
+def read_operations(stream, format: str) -> Iterator[Dict[str, object]]:
+    """
+    Lazily reads operations from a stream of JSON Lines ('jsonl') or YAML documents ('yaml')
+    """
+    if format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        for document in yaml.load_all(stream, Loader=loader):
+            if document is not None:
+                yield document
+
+
+def get_fields(operation: Dict[str, object], fields: Dict[str, type],
+               ignored=('op',)) -> Dict[str, object]:
+    """
+    Returns the non-null properties of an operation, checking their names and types
+    """
+    output = dict()
+    for name, value in operation.items():
+        if name in ignored:
+            continue
+        if name not in fields:
+            raise OperationError(f"unknown property `{name}`")
+        expected = fields[name]
+        if value is None:
+            continue
+        # bools are ints in Python; don't accept them in place of numbers
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise OperationError(f"`{name}` should be of type {expected.__name__}")
+        output[name] = value
+
+    grader = output.get('grader', None)
+    if grader is not None and grader not in GRADERS:
+        raise OperationError(f"unknown grader `{grader}`")
+    return output
+
+
+def get_question(meta, operation: Dict[str, object], key: str = 'id'):
+    id = operation.get(key, None)
+    if id is None:
+        raise OperationError(f"missing `{key}`")
+    question = meta.find_question(str(id))
+    if question is None:
+        raise OperationError(f"question `{id}` was not found")
+    return question
+
+
+def add_question(meta, operation):
+    id = operation.get('id', None)
+    if id is None:
+        raise OperationError("missing `id`")
+    if meta.find_question(str(id)):
+        raise OperationError(f"question `{id}` already exists")
+    args = get_fields(operation, QUESTION_FIELDS, ('op', 'id'))
+    meta.insert_question(False, str(id), **args)
+
+
+def edit_question(meta, operation):
+    get_question(meta, operation)  # must exist
+    args = get_fields(operation, QUESTION_FIELDS, ('op', 'id'))
+    meta.insert_question(True, str(operation['id']), **args)
+
+
+def add_answer(meta, operation):
+    question = get_question(meta, operation, 'question_id')
+    args = get_fields(operation, ANSWER_FIELDS, ('op', 'question_id'))
+    id = args.pop('id', None)
+    question.insert_answer(id, **args)
+
+
+def edit_defaults(meta, operation):
+    args = get_fields(operation, QUESTION_FIELDS)
+    args.pop('text', None)
+    for name, value in args.items():
+        setattr(meta.question_defaults, name, value)
+
+
+OPERATIONS = {
+    'add-question': add_question,
+    'edit-question': edit_question,
+    'add-answer': add_answer,
+    'edit-defaults': edit_defaults
+}
+"""Dict[str, Callable]: operation handlers, named after the matching commands"""
+
+
+def apply_operation(meta, operation: Dict[str, object]):
+    """
+    Applies a single operation to the problem set
+
+    Raises
+        OperationError: if the operation is invalid
+    """
+    if not isinstance(operation, dict):
+        raise OperationError("operations should be mappings")
+    name = operation.get('op', None)
+    handler = OPERATIONS.get(name, None)
+    if handler is None:
+        raise OperationError(f"unknown operation `{name}`")
+    handler(meta, operation)
@@ -0,0 +1,124 @@
+# lightweight per-stage timing of the hot paths (see `cli --profile`)
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager, nullcontext
+import functools
+import time
+
+STAGE_WIDTH = 18
+
+
+class Stage:
+    """Accumulated measurements of a single stage"""
+    __slots__ = ('calls', 'seconds', 'items', 'bytes')
+
+    def __init__(self, calls: int = 0, seconds: float = 0.0, items: int = 0, bytes: int = 0):
+        self.calls = calls
+        self.seconds = seconds
+        self.items = items
+        self.bytes = bytes
+
+
+class Profiler:
+    """
+    Collects wall time, calls, processed items and bytes per named stage.
+    Stages may nest; the time of a stage includes the time of its inner stages.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = dict()
+        self.started_at = time.perf_counter()
+
+    def add(self, name: str, seconds: float, calls: int = 1, items: int = 1, bytes: int = 0):
+        stage = self.stages.get(name, None)
+        if stage is None:
+            stage = self.stages[name] = Stage()
+        stage.calls += calls
+        stage.seconds += seconds
+        stage.items += items
+        stage.bytes += bytes
+
+    def snapshot(self) -> Dict[str, tuple]:
+        """Returns the picklable measurements and starts over"""
+        stages = {name: (stage.calls, stage.seconds, stage.items, stage.bytes)
+                  for name, stage in self.stages.items()}
+        self.stages = dict()
+        return stages
+
+    def merge(self, stages: Dict[str, tuple]):
+        """Adds the `snapshot` of another profiler (e.g. of a worker process)"""
+        for name, (calls, seconds, items, bytes) in stages.items():
+            self.add(name, seconds, calls, items, bytes)
+
+    def report(self) -> List[str]:
+        """Returns the lines of a per-stage table, slowest stages first"""
+        elapsed = time.perf_counter() - self.started_at
+        lines = [f"{'Stage':<{STAGE_WIDTH}} {'Calls':>8} {'Total s':>9} {'Mean ms':>9} "
+                 f"{'Items/s':>10} {'MB':>8}"]
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            mean = stage.seconds * 1000 / stage.calls if stage.calls else 0
+            rate = f"{stage.items / stage.seconds:.1f}" if stage.seconds > 0 else '-'
+            size = f"{stage.bytes / 2 ** 20:.2f}" if stage.bytes else '-'
+            lines.append(f"{name:<{STAGE_WIDTH}} {stage.calls:>8} {stage.seconds:>9.3f} "
+                         f"{mean:>9.3f} {rate:>10} {size:>8}")
+        lines.append(f"Wall time: {elapsed:.3f}s (stages of worker processes are summed)")
+        return lines
+
+
+profiler: Optional[Profiler] = None
+"""Profiler: collects the measurements of `timed` functions and `stage` blocks; disabled if None"""
+
+
+def timed(name: str, items: Callable = None, size: Callable = None):
+    """
+    Decorator measuring every call of a function as the stage `name`.
+    `items` and `size` are called with the same arguments to count the processed
+    items and bytes; they're only evaluated while profiling.
+    When profiling is disabled, the only cost is a function call and a global lookup.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # the profiler can't be disabled by the function itself
+                profiler.add(name, time.perf_counter() - start,
+                             items=items(*args, **kwargs) if items else 1,
+                             bytes=size(*args, **kwargs) if size else 0)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _measure(name: str, items: int):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add(name, time.perf_counter() - start, items=items)
+
+
+def stage(name: str, items: int = 1):
+    """Context manager measuring a block of code as the stage `name`; see `timed`"""
+    if profiler is None:
+        return nullcontext()
+    return _measure(name, items)
+
+
+def worker_result(result):
+    """
+    Pairs the result of a worker process task with the measurements collected
+    since the previous task; the parent process unpacks it with `merge_result`
+    """
+    return result, profiler.snapshot() if profiler else None
+
+
+def merge_result(item):
+    """Returns the result of `worker_result`, adding its measurements to `profiler`"""
+    result, stages = item
+    if stages and profiler:
+        profiler.merge(stages)
+    return result
@@ -0,0 +1,340 @@
+# local HTTP grading service keeping compiled problem sets in memory (see `serve`)
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+import asyncio
+import io
+import json
+import math
+import random
+import time
+import uuid
+import related
+from loader import YAML_LOADER
+from models import ProblemSet, ExamGenerator, SchemeError
+from compact import exam_from_data, write_exam
+from utils import derive_seed, percentage
+
+MAX_PAYLOAD_SIZE = 16 * 2 ** 20
+"""int: largest accepted request body, in bytes"""
+
+LATENCY_WINDOW = 1024
+"""int: number of recent requests the latency percentiles are computed from"""
+
+STATUS_TEXTS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 415: 'Unsupported Media Type', 422: 'Unprocessable Entity',
+    500: 'Internal Server Error'
+}
+
+BODY_TYPES = {
+    '/grade': {'application/json', 'application/x-yaml', 'application/yaml'},
+    '/generate': {'application/json'}
+}
+"""Dict[str, Set[str]]: accepted request bodies by path; browsers can't send any of them
+to another origin without a CORS preflight, which the server never approves"""
+
+
+class ServiceError(Exception):
+    """Rejected request; `status` is the HTTP status of the response"""
+
+    def __init__(self, status: int, message: str, details: Optional[List] = None):
+        super().__init__(status, message, details)  # keeps the error picklable
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+# grading and generation run in executor workers, which keep their own copies
+# of the problem sets
+
+_problem_sets: Dict[str, Tuple[ProblemSet, object, ExamGenerator]] = dict()
+"""Dict[str, Tuple[ProblemSet, AnswerKey, ExamGenerator]]: worker state by problem set UUID"""
+
+
+def _init_service_worker(problem_sets: List[ProblemSet]):
+    global _problem_sets
+    _problem_sets = {str(meta.uuid): (meta, meta.compile(), ExamGenerator(meta))
+                     for meta in problem_sets}
+
+
+def _find_problem_set(uuid: Optional[str]):
+    if uuid is None and len(_problem_sets) == 1:
+        return next(iter(_problem_sets.values()))
+    entry = _problem_sets.get(str(uuid), None)
+    if entry is None:
+        raise ServiceError(404, f"Unknown problem set `{uuid}`")
+    return entry
+
+
+def grade_payload(payload: bytes) -> Dict[str, object]:
+    """
+    Grades an exam in the full or reference-only format (YAML or JSON) against
+    the loaded problem set it was created from, named by its `meta_uuid`
+    """
+    try:
+        data = related.from_yaml(io.StringIO(payload.decode('utf-8')), loader_cls=YAML_LOADER)
+    except Exception as ex:
+        raise ServiceError(400, f"Invalid exam ({ex})") from ex
+    if not isinstance(data, dict):
+        raise ServiceError(400, "Invalid exam (expected a mapping)")
+    # without it, the exam would get a random UUID of its own
+    try:
+        uuid.UUID(str(data['meta_uuid']))
+    except (KeyError, ValueError) as ex:
+        raise ServiceError(400, "Invalid exam (missing or invalid `meta_uuid`)") from ex
+    try:
+        exam = exam_from_data(data)
+    except Exception as ex:
+        raise ServiceError(400, f"Invalid exam ({ex})") from ex
+    _, key, _ = _find_problem_set(exam.meta_uuid)
+    try:
+        key.ensure_exam_compatibility(exam)
+    except SchemeError as ex:
+        details = [{name: value if value is None or isinstance(value, (int, str)) else str(value)
+                    for name, value in mismatch._asdict().items()}
+                   for mismatch in ex.mismatches]
+        raise ServiceError(422, str(ex), details) from ex
+
+    questions = []
+    score = exam.get_score(key, lambda question, points: questions.append(
+        {'id': question.id, 'score': points, 'points': question.points}))
+    return {
+        'problem_set': str(key.uuid),
+        'user_name': exam.user_name,
+        'was_user_completed': exam.was_user_completed,
+        'score': score,
+        'max_score': exam.max_score,
+        'percentage': round(percentage(score, exam.max_score), 2),
+        'questions': questions
+    }
+
+
+def generate_payload(request: Dict[str, object]) -> str:
+    """
+    Generates an exam as YAML; the request may contain `problem_set` (required if several
+    are loaded), `num_questions`, `description`, `title`, `user_name`, `seed` and
+    `format` ('full' or 'refs'). Like `gen-exams`, a seed and a user name reproduce the exam.
+    """
+    meta, _, generator = _find_problem_set(request.get('problem_set', None))
+    try:
+        num_questions = int(request['num_questions'])
+        user_name = request.get('user_name', None)
+        seed = request.get('seed', None)
+        if seed is None:
+            rng = random.Random()
+        else:
+            rng = random.Random(derive_seed(int(seed), user_name or ''))
+        exam = generator.generate(num_questions, str(request.get('description', '')),
+                                  request.get('title', None), rng)
+    except (KeyError, TypeError, ValueError) as ex:
+        raise ServiceError(400, f"Invalid generation request ({ex!r})") from ex
+    except SchemeError as ex:
+        # e.g. questions without enough answers to pick from
+        raise ServiceError(422, f"Could not generate the exam ({ex})") from ex
+    exam.user_name = user_name
+    stream = io.StringIO()
+    write_exam(exam, stream, request.get('format', 'full') == 'refs')
+    return stream.getvalue()
+
+
+class RouteStats:
+    """Request counters and recent latencies of a single route"""
+    __slots__ = ('requests', 'errors', 'seconds', 'max_seconds', 'recent')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, seconds: float, error: bool):
+        self.requests += 1
+        self.errors += int(error)
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+
+    def to_dict(self) -> Dict[str, object]:
+        recent = sorted(self.recent)
+
+        def percentile(q):
+            # nearest rank
+            return round(recent[max(0, math.ceil(q * len(recent)) - 1)] * 1000, 3)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_ms': round(self.seconds * 1000 / self.requests, 3) if self.requests else None,
+            'p50_ms': percentile(0.5) if recent else None,
+            'p95_ms': percentile(0.95) if recent else None,
+            'max_ms': round(self.max_seconds * 1000, 3)
+        }
+
+
+class GradingService:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies) grading and generating
+    exams of the loaded problem sets. Connections are handled concurrently by asyncio;
+    parsing, validation and grading run in an executor:
+    a process pool if `jobs` > 1, otherwise a single thread.
+
+    Routes
+        GET /health, GET /problem-sets, GET /stats,
+        POST /grade (exam YAML/JSON), POST /generate (JSON, see `generate_payload`)
+    """
+
+    def __init__(self, problem_sets: List[ProblemSet], jobs: int = 1):
+        self.problem_sets = problem_sets
+        self.jobs = jobs
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(jobs, initializer=_init_service_worker,
+                                                initargs=(problem_sets,))
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=_init_service_worker,
+                                               initargs=(problem_sets,))
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/problem-sets'): self.list_problem_sets,
+            ('GET', '/stats'): self.stats,
+            ('POST', '/grade'): self.grade,
+            ('POST', '/generate'): self.generate
+        }
+        self.route_stats = {f"{method} {path}": RouteStats() for method, path in self.routes}
+        self.started_at = time.monotonic()
+        self.in_flight = 0
+
+    async def health(self, body: bytes):
+        return 200, {'status': 'ok'}
+
+    async def list_problem_sets(self, body: bytes):
+        return 200, [{'uuid': str(meta.uuid), 'title': meta.title,
+                      'questions': len(meta.questions)} for meta in self.problem_sets]
+
+    async def stats(self, body: bytes):
+        uptime = time.monotonic() - self.started_at
+        requests = sum(stats.requests for stats in self.route_stats.values())
+        return 200, {
+            'uptime_s': round(uptime, 3),
+            'requests': requests,
+            'requests_per_second': round(requests / uptime, 3) if uptime > 0 else None,
+            'in_flight': self.in_flight,
+            'routes': {route: stats.to_dict() for route, stats in self.route_stats.items()}
+        }
+
+    async def grade(self, body: bytes):
+        loop = asyncio.get_running_loop()
+        return 200, await loop.run_in_executor(self.executor, grade_payload, body)
+
+    async def generate(self, body: bytes):
+        try:
+            request = json.loads(body.decode('utf-8') or '{}')
+        except ValueError as ex:
+            raise ServiceError(400, f"Invalid JSON ({ex})") from ex
+        if not isinstance(request, dict):
+            raise ServiceError(400, "Expected a JSON object")
+        loop = asyncio.get_running_loop()
+        return 200, await loop.run_in_executor(self.executor, generate_payload, request)
+
+    async def dispatch(self, method: str, target: str, content_type: str,
+                       body: bytes) -> Tuple[int, object]:
+        path = urlsplit(target).path.rstrip('/') or '/'
+        handler = self.routes.get((method, path), None)
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                raise ServiceError(405, f"Method {method} not allowed")
+            raise ServiceError(404, f"Unknown path {path}")
+
+        start = time.perf_counter()
+        error = True
+        self.in_flight += 1
+        try:
+            body_types = BODY_TYPES.get(path, None)
+            if method == 'POST' and content_type not in body_types:
+                raise ServiceError(415, f"Expected one of the content types: "
+                                        f"{', '.join(sorted(body_types))}")
+            result = await handler(body)
+            error = False
+            return result
+        finally:
+            self.in_flight -= 1
+            self.route_stats[f"{method} {path}"].add(time.perf_counter() - start, error)
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                    if not version.startswith('HTTP/') or length < 0:
+                        raise ValueError(request_line)
+                except ValueError:
+                    # the rest of the stream can't be trusted to start a request
+                    writer.write(self.format_response(400, {'error': "Malformed request"},
+                                                      False))
+                    await writer.drain()
+                    break
+                keep_alive = version == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+
+                if length > MAX_PAYLOAD_SIZE:
+                    status, result = 413, {'error': f"Payloads are limited to "
+                                                    f"{MAX_PAYLOAD_SIZE} bytes"}
+                    keep_alive = False  # the body isn't read
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        content_type = headers.get('content-type', '')
+                        content_type = content_type.split(';')[0].strip().lower()
+                        status, result = await self.dispatch(method, target, content_type,
+                                                             body)
+                    except ServiceError as ex:
+                        status, result = ex.status, {'error': ex.message}
+                        if ex.details is not None:
+                            result['details'] = ex.details
+                    except Exception as ex:
+                        status, result = 500, {'error': f"{type(ex).__name__}: {ex}"}
+
+                writer.write(self.format_response(status, result, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # malformed request or the client went away
+        finally:
+            writer.close()
+
+    @staticmethod
+    def format_response(status: int, result, keep_alive: bool) -> bytes:
+        if isinstance(result, str):
+            content_type, body = 'application/x-yaml', result.encode('utf-8')
+        else:
+            content_type, body = 'application/json', json.dumps(result).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {STATUS_TEXTS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode('latin-1') + body
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, unix_socket: str = None):
+        """Starts listening; returns the asyncio server"""
+        if unix_socket:
+            return await asyncio.start_unix_server(self.handle_connection, unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown()
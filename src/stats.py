@@ -0,0 +1,133 @@
+# constant-memory statistics of exam scores (see `grade-exams --top`)
+from typing import Dict, List, Optional, Tuple
+import heapq
+import math
+from utils import percentage
+
+RankedUser = Tuple[str, Tuple[int, int, float]]
+"""type: (user, (score, max_score, percentage)) row of a leaderboard"""
+
+
+def rank_users(user_scores: Dict[str, Tuple[int, int, float]],
+               limit: Optional[int] = None) -> List[RankedUser]:
+    """
+    Returns the users of a user -> (score, max_score, percentage) mapping,
+    best percentage first (ties keep the mapping order); at most `limit` of them
+    """
+    return sorted(user_scores.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+
+
+class RunningStats:
+    """
+    Exact count, mean and variance (Welford's algorithm) and exact median
+    of integer scores. Scores are bounded by the exam's maximum score, so the
+    histogram used for the median takes O(max score) memory at most.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared differences from the mean
+        self.histogram: Dict[int, int] = dict()  # score -> occurrences
+
+    def add(self, value: int):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.histogram[value] = self.histogram.get(value, 0) + 1
+
+    @property
+    def variance(self) -> float:
+        """Population variance"""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def _value_at(self, positions: List[int]) -> List[int]:
+        # values at the given (ascending) positions of the sorted values
+        values = []
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            while len(values) < len(positions) and positions[len(values)] < seen:
+                values.append(value)
+        return values
+
+    def median(self) -> float:
+        """Same as `statistics.median` of all values"""
+        if not self.count:
+            raise ValueError("no values")
+        low, high = self._value_at([(self.count - 1) // 2, self.count // 2])
+        return low if low == high else (low + high) / 2
+
+
+class TopK:
+    """Keeps the `k` items with the greatest keys; ties keep the earlier item"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap = []  # (key, -sequence, item); the root is evicted first
+        self._sequence = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, key, item):
+        self._sequence += 1
+        entry = (key, -self._sequence, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif self._heap and entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self) -> List[Tuple[object, object]]:
+        """Returns (key, item) pairs, best first"""
+        return [(key, item) for key, _, item in sorted(self._heap, reverse=True)]
+
+
+class StreamingSummary:
+    """
+    Folds exam records into stats that take constant memory, whatever the number of
+    exams: every exam counts separately (users aren't deduplicated), and only
+    the best `k` exams are ranked. See `GradingSummary`.
+    """
+
+    def __init__(self, k: int):
+        self.stats = RunningStats()
+        self.leaderboard = TopK(k)
+        self.question_stats = dict()  # question id -> {score: occurrences}
+        self.max_score = 0
+
+    def add(self, record):
+        percent = percentage(record.score, record.max_score)
+        self.stats.add(record.score)
+        self.leaderboard.add(percent, (record.user, record.score, record.max_score))
+        self.max_score = max(self.max_score, record.max_score)
+
+        for qid, score in zip(record.questions, record.scores):
+            counts = self.question_stats.setdefault(qid, dict())
+            counts[score] = counts.get(score, 0) + 1  # +1 occurrence
+
+    def ranked_users(self, limit: Optional[int] = None) -> List[RankedUser]:
+        """
+        Returns the ranked exams, best first (see `rank_users`); unlike in other
+        summaries, a user may appear repeatedly
+        """
+        return [(user, (score, max_score, percent)) for percent, (user, score, max_score)
+                in self.leaderboard.items()[:limit]]
+
+    def score_histogram(self) -> Dict[int, int]:
+        return dict(self.stats.histogram)
+
+    def general_stats(self) -> Tuple[int, float, float]:
+        """
+        Returns (count, mean, median) of exam scores
+        """
+        return self.stats.count, self.stats.mean, self.stats.median()
+
+    def stdev(self) -> float:
+        """Population standard deviation of exam scores"""
+        return self.stats.stdev
@@ -0,0 +1,206 @@
+# SQLite-backed storage of graded exams
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from stats import RankedUser, rank_users
+from utils import percentage
+
+SCHEMA_VERSION = 2
+"""int: stored as the database's `user_version`; stores of other versions are recreated"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS exams (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    user TEXT,
+    score INTEGER,
+    max_score INTEGER,
+    completed_at TEXT,  -- ISO 8601
+    error TEXT  -- set if the exam couldn't be graded
+);
+CREATE INDEX IF NOT EXISTS exams_user ON exams (user);
+CREATE TABLE IF NOT EXISTS question_scores (
+    path TEXT NOT NULL REFERENCES exams (path) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    question_id TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (path, position)
+);
+CREATE INDEX IF NOT EXISTS question_scores_question ON question_scores (question_id, score);
+"""
+
+# latest exam of each user, like `GradingSummary` (see `ExamRecord.recency`)
+USER_EXAMS = """
+SELECT user, score, max_score FROM exams AS exam WHERE error IS NULL AND NOT EXISTS (
+    SELECT 1 FROM exams AS later WHERE later.error IS NULL AND later.user = exam.user
+    AND (COALESCE(later.completed_at, ''), later.path) > (COALESCE(exam.completed_at, ''), exam.path)
+)
+"""
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def key_fingerprint(key) -> str:
+    """
+    Returns a digest of everything in the AnswerKey that affects grading
+    """
+    questions = [(qid, q.points, q.grader, sorted(q.answer_ids), sorted(q.correct_ids))
+                 for qid, q in sorted(key.questions.items())]
+    data = json.dumps([str(key.uuid), questions])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class ResultsStore:
+    """
+    Stores graded exams of a single directory, keyed by file path and content hash.
+    Grading results are dropped whenever the problem set's answer key changes.
+    Usable as a context manager closing the database.
+    """
+
+    def __init__(self, path: str, key):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version != SCHEMA_VERSION:
+            self.connection.executescript(
+                'DROP TABLE IF EXISTS question_scores; DROP TABLE IF EXISTS exams; '
+                'DROP TABLE IF EXISTS info;')
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.connection.executescript(SCHEMA)
+        self._pending = dict()  # path -> (mtime_ns, size, hash)
+
+        fingerprint = key_fingerprint(key)
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT value FROM info WHERE name = 'key'").fetchone()
+            if row is None or row[0] != fingerprint:
+                self.connection.execute('DELETE FROM exams')
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO info (name, value) VALUES ('key', ?)",
+                    (fingerprint,))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sync(self, paths: List[str]) -> List[str]:
+        """
+        Forgets files that are gone and returns the new or changed ones, in input order
+        """
+        stored = {path: (mtime_ns, size, digest) for path, mtime_ns, size, digest
+                  in self.connection.execute('SELECT path, mtime_ns, size, hash FROM exams')}
+        pending = []
+        touched = []  # (mtime_ns, size, path) of changed files with the same content
+
+        for path in paths:
+            stat = os.stat(path)
+            entry = stored.pop(path, None)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            digest = file_hash(path)
+            if entry and entry[2] == digest:
+                touched.append((stat.st_mtime_ns, stat.st_size, path))
+                continue
+            self._pending[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            pending.append(path)
+
+        with self.connection:
+            self.connection.executemany('DELETE FROM exams WHERE path = ?',
+                                        ((path,) for path in stored))
+            self.connection.executemany('UPDATE exams SET mtime_ns = ?, size = ? WHERE path = ?',
+                                        touched)
+        return pending
+
+    def add(self, path: str, record, error: Optional[str]):
+        """
+        Stores the grading result of a file returned by `sync`
+        """
+        mtime_ns, size, digest = self._pending.pop(path)
+        user, score, max_score, completed_at = \
+            (record.user, record.score, record.max_score, record.completed_at) \
+            if record else (None, None, None, None)
+        self.connection.execute('DELETE FROM exams WHERE path = ?', (path,))
+        self.connection.execute(
+            'INSERT INTO exams (path, mtime_ns, size, hash, user, score, max_score, '
+            'completed_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, mtime_ns, size, digest, user, score, max_score, completed_at, error))
+        if record:
+            self.connection.executemany(
+                'INSERT INTO question_scores (path, position, question_id, score) '
+                'VALUES (?, ?, ?, ?)',
+                ((path, position, qid, score) for position, (qid, score)
+                 in enumerate(zip(record.questions, record.scores))))
+
+    def commit(self):
+        self.connection.commit()
+
+    @property
+    def user_scores(self) -> Dict[str, Tuple[int, int, float]]:
+        """user -> (score, max_score, percentage)"""
+        return {user: (score, max_score, percentage(score, max_score))
+                for user, score, max_score in self.connection.execute(USER_EXAMS)}
+
+    def ranked_users(self, limit: Optional[int] = None) -> List[RankedUser]:
+        """See `rank_users`"""
+        return rank_users(self.user_scores, limit)
+
+    @property
+    def question_stats(self) -> Dict[str, Dict[int, int]]:
+        """question id -> {score: occurrences}"""
+        stats = dict()
+        rows = self.connection.execute(
+            'SELECT question_id, score, COUNT(*) FROM question_scores '
+            'GROUP BY question_id, score ORDER BY question_id, score')
+        for qid, score, count in rows:
+            stats.setdefault(qid, dict())[score] = count
+        return stats
+
+    @property
+    def max_score(self) -> int:
+        row = self.connection.execute(
+            'SELECT MAX(max_score) FROM exams WHERE error IS NULL').fetchone()
+        return row[0] or 0
+
+    def scores(self) -> List[int]:
+        return [score for _, score, *_ in self.connection.execute(USER_EXAMS)]
+
+    def score_histogram(self) -> Dict[int, int]:
+        """user score -> occurrences"""
+        return dict(self.connection.execute(
+            f'SELECT score, COUNT(*) FROM ({USER_EXAMS}) GROUP BY score'))
+
+    def general_stats(self) -> Tuple[int, float, float]:
+        """
+        Returns (count, mean, median) of user scores
+        """
+        count, mean = self.connection.execute(
+            f'SELECT COUNT(*), AVG(score) FROM ({USER_EXAMS})').fetchone()
+        # average of the middle one or two scores
+        median, = self.connection.execute(
+            f'SELECT AVG(score) FROM (SELECT score FROM ({USER_EXAMS}) '
+            f'ORDER BY score LIMIT 2 - ? % 2 OFFSET (? - 1) / 2)',
+            (count, count)).fetchone()
+        return count, mean, median
+
+    def stdev(self) -> float:
+        """Population standard deviation of user scores"""
+        mean, mean_square = self.connection.execute(
+            f'SELECT AVG(score), AVG(score * score) FROM ({USER_EXAMS})').fetchone()
+        return math.sqrt(max(0.0, mean_square - mean * mean)) if mean is not None else 0.0
@@ -0,0 +1,121 @@
+# debounced background saving used by the UI (kept free of kivy imports)
+from typing import Any, Callable, Optional, Tuple
+import threading
+import time
+
+
+class Autosaver:
+    """
+    Coalesces bursts of changes into a single save, performed on a background
+    thread once nothing has changed for `delay` seconds.
+    Saves never overlap, so the most recent one always wins.
+
+    The state to save is captured by `snapshot` on the thread reporting the change,
+    so the worker never reads objects the UI keeps modifying; `save` only writes
+    the latest snapshot.
+    """
+
+    def __init__(self, save: Callable[[Any], None], snapshot: Callable[[], Any],
+                 delay: float = 1.0, on_error: Optional[Callable[[Exception], None]] = None):
+        self.save = save  # called with a snapshot, from the worker thread
+        self.snapshot = snapshot  # called from the threads calling `schedule` and `save_now`
+        self.delay = delay
+        self.on_error = on_error  # also called from the worker thread
+
+        self._condition = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._deadline = None  # monotonic time of the pending save
+        self._changes = 0  # number of changes so far
+        self._saved = 0  # number of changes covered by the last save
+        self._state = None  # snapshot taken at the latest change
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> bool:
+        """Whether there are changes that haven't been saved yet"""
+        return self._saved < self._changes
+
+    def schedule(self):
+        """Notes a change and takes a snapshot; called on every UI event"""
+        state = self.snapshot()
+        with self._condition:
+            self._state = state
+            self._changes += 1
+            self._deadline = time.monotonic() + self.delay
+            self._condition.notify_all()
+
+    def save_now(self):
+        """
+        Saves synchronously (after any save in progress), cancelling the pending one
+
+        Raises
+            Exception: any error raised by `save`
+        """
+        with self._save_lock:
+            state = self.snapshot()
+            with self._condition:
+                changes = self._changes
+                self._deadline = None
+            self.save(state)
+            self._mark_saved(changes)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Performs the pending save right away and waits for it;
+        returns False if it didn't finish within `timeout` seconds
+        """
+        with self._condition:
+            changes = self._changes
+            if self._deadline is not None:
+                self._deadline = time.monotonic()
+                self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._saved >= changes or self._closed,
+                                            timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Saves pending changes and stops the worker thread"""
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _mark_saved(self, changes: int):
+        with self._condition:
+            self._saved = max(self._saved, changes)
+            self._condition.notify_all()
+
+    def _wait(self) -> Optional[Tuple[int, Any]]:
+        """Waits until a save is due; returns the number of changes it covers and its snapshot"""
+        with self._condition:
+            while not self._closed:
+                if self._deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self._deadline = None
+                return self._changes, self._state
+            return None
+
+    def _run(self):
+        while True:
+            due = self._wait()
+            if due is None:
+                return
+            changes, state = due
+            with self._save_lock:
+                if self._saved >= changes:
+                    continue  # already covered by `save_now`
+                try:
+                    self.save(state)
+                except Exception as ex:
+                    if self.on_error:
+                        self.on_error(ex)
+                # failed saves count as done; the next change tries again
+                self._mark_saved(changes)
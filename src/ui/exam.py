@@ -1,12 +1,19 @@
 import kivy
+import copy
 import os
 from datetime import datetime
 from ui.stubs import TextLabel, VerticalGrid, SaveDialog
+from ui.scoring import ExamScore
+from ui.autosave import Autosaver
+from compact import save_exam as save_exam_file
 from kivy.app import App, Widget
-from kivy.uix.scrollview import ScrollView
+from kivy.clock import Clock
+from kivy.metrics import dp
+from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.popup import Popup
-from kivy.core.window import Window
 from kivy.uix.layout import Layout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.lang.builder import Builder
 from kivy.properties import ObjectProperty, NumericProperty, StringProperty, BooleanProperty
 from utils import percentage
@@ -42,21 +49,24 @@ NO_SCORE = -1e9
 """int: Constant that represents invalid question/exam score"""
 
 
+AUTOSAVE_DELAY = 1.5
+"""float: Seconds without changes after which the exam is saved in the background"""
+
+QUESTION_HEIGHT = dp(40)
+ANSWER_HEIGHT = dp(30)
+"""float: Estimated heights of question rows; corrected once a row is displayed"""
+
+
 class ExamAnswer(VerticalGrid):
-    answer = ObjectProperty()
+    answer = ObjectProperty(None)
     answer_meta = ObjectProperty(None)
-    grouping = StringProperty(None)
+    grouping = StringProperty(None, allownone=True)
     is_selected = BooleanProperty()
     is_correct = BooleanProperty()
 
-    def __init__(self, answer_meta, answer, grouping, **kwargs):
+    def __init__(self, **kwargs):
         super(ExamAnswer, self).__init__(**kwargs)
         self.bind(is_selected=wrap_action(self.save_changes))
-        self.answer_meta = answer_meta
-        self.answer = answer
-        self.grouping = grouping
-
-        self.build()
 
     @property
     def exam_question(self):
@@ -70,10 +80,20 @@ class ExamAnswer(VerticalGrid):
         self.is_selected = value
 
     def save_changes(self):
-        if self.answer:
-            self.answer.is_selected = self.is_selected
+        if self.answer is None or self.answer.is_selected == self.is_selected:
+            return  # nothing changed (e.g. the widget has just been reused)
+        self.answer.is_selected = self.is_selected
         if self.exam_question:
-            get_app().dispatch('on_answer_changed', self.exam_question.question)
+            get_app().change_answer(self.exam_question.question)
+
+    def show(self, answer_meta, answer, grouping):
+        """Displays the given answer, reusing this widget"""
+        # leave the previous radio-box group before the selection changes
+        self.grouping = None
+        self.answer_meta = answer_meta
+        self.answer = answer
+        self.build()
+        self.grouping = grouping
 
     def build(self):
         if self.answer:
@@ -82,58 +102,71 @@ class ExamAnswer(VerticalGrid):
         self.is_correct = meta and meta.is_correct
 
 
-class ExamQuestion(VerticalGrid):
+class ExamQuestion(RecycleDataViewBehavior, VerticalGrid):
+    """
+    Recycled view of a single exam question;
+    the displayed state is always read back from the Exam model
+    """
+    index = NumericProperty(0)
     num = NumericProperty(0)
     points_graded = NumericProperty(NO_SCORE)
     points_str = StringProperty('')
-    question = ObjectProperty()
+    question = ObjectProperty(None)
     question_meta = ObjectProperty(None)
     text = StringProperty('')
 
-    def __init__(self, question_meta, question, num, **kwargs):
+    def __init__(self, **kwargs):
         super(ExamQuestion, self).__init__(**kwargs)
 
-        update = wrap_action(self.update)
-        get_app().bind(should_grade=update, on_answer_changed=update)
+        get_app().bind(should_grade=wrap_action(self.update),
+                       on_answer_changed=self.on_answer_changed)
 
         self.container = get_container(self)
+        self.answers = []  # answer widgets, reused between questions
 
-        self.num = num
-        self.answers = set()
-        self.question_meta = question_meta
-        self.question = question
-
+    def refresh_view_attrs(self, rv, index, data):
+        super(ExamQuestion, self).refresh_view_attrs(rv, index, data)
+        app = get_app()
+        self.num = index + 1
+        self.question = app.exam.questions[index]
+        meta = app.exam_meta
+        self.question_meta = meta.find_question(self.question.id) if meta else None
         self.build()
 
-    def clear(self):
-        for widget in self.answers:
-            self.container.remove_widget(widget)
-        self.answers = set()
+    def refresh_view_layout(self, rv, index, layout, viewport):
+        super(ExamQuestion, self).refresh_view_layout(rv, index, layout, viewport)
+        # report the measured height; the layout manager adapts to it
+        self.height = self.minimum_height
 
     def build(self):
-        self.clear()
-        if self.question:
-            for ans in self.question.answers:
-                self.build_answer(ans)
-        self.update()
+        answers = self.question.answers if self.question else []
+        while len(self.answers) < len(answers):
+            widget = ExamAnswer()
+            self.container.add_widget(widget)
+            self.answers.append(widget)
+        while len(self.answers) > len(answers):
+            self.container.remove_widget(self.answers.pop())
 
-    def build_answer(self, answer):
         meta = self.question_meta
-        ans_meta = meta.find_answer(answer.id) if meta else None
         # add checkbox grouping if there's only one answer
         grouping = None if self.question.is_multiple_choice else str(self.question.id)
-        widget = ExamAnswer(ans_meta, answer, grouping)
+        for widget, answer in zip(self.answers, answers):
+            ans_meta = meta.find_answer(answer.id) if meta else None
+            widget.show(ans_meta, answer, grouping)
+        self.update()
 
-        self.container.add_widget(widget)
-        self.answers.add(widget)
+    def on_answer_changed(self, app, question):
+        # only the question that changed needs to be regraded
+        if question is self.question:
+            self.update()
 
     def update(self):
-        meta = self.question_meta
         if self.question:
             self.text = self.question.text
 
-            should_grade = get_app().should_grade
-            self.points_graded = self.question.grade(meta) if should_grade else NO_SCORE
+            app = get_app()
+            should_grade = app.should_grade
+            self.points_graded = app.exam_score.get(self.question) if should_grade else NO_SCORE
 
             # update points display
             if self.points_graded != NO_SCORE:
@@ -142,49 +175,29 @@ class ExamQuestion(VerticalGrid):
                 self.points_str = f"{self.question.points}p"
 
 
-class ExamQuestions(VerticalGrid):
+class ExamQuestions(RecycleView):
+    """
+    Virtualized list of exam questions; widgets are only built for visible rows
+    """
+
     def __init__(self, **kwargs):
         super(ExamQuestions, self).__init__(**kwargs)
         app = get_app()
         app.bind(exam_meta=wrap_action(self.build), exam=wrap_action(self.build))
 
-        self.container = get_container(self)
-
-        self.questions = set()
-        self.exam_meta = app.exam_meta
-        self.exam = app.exam
-
         self.build()
 
-    def clear(self):
-        for widget in self.questions:
-            self.container.remove_widget(widget)
-        self.questions = set()
-
     def build(self):
-        self.clear()
-        if self.exam:
-            for question in self.exam.questions:
-                self.build_question(question)
-
-    def build_question(self, question):
-        meta = self.exam_meta
-        q_meta = meta.find_question(question.id) if meta else None
-        # numerate the question
-        id = len(self.questions) + 1
-
-        widget = ExamQuestion(q_meta, question, id)
-
-        self.container.add_widget(widget)
-        self.questions.add(widget)
+        exam = get_app().exam
+        questions = exam.questions if exam else []
+        self.data = [{'height': QUESTION_HEIGHT + ANSWER_HEIGHT * len(question.answers)}
+                     for question in questions]
+        # the exam may have changed in-place (e.g. cleared) with the same data
+        self.refresh_from_data()
 
 
-class ExamView(VerticalGrid):
-    def __init__(self, **kwargs):
-        super(ExamView, self).__init__(**kwargs)
-
-        container = self.ids.container
-        container.add_widget(ExamQuestions())
+class ExamView(BoxLayout):
+    pass
 
 
 class ExamApp(App):
@@ -204,7 +217,11 @@ class ExamApp(App):
 
         self.exam_meta = exam_meta
         self.exam = exam
+        self.exam_score = ExamScore(exam, exam_meta)
+        self.max_score = exam.max_score
         self.save_location = save_location
+        self.autosaver = Autosaver(self.autosave, self.exam_snapshot, AUTOSAVE_DELAY,
+                                   self.on_autosave_error)
         super(ExamApp, self).__init__(**kwargs)
 
         self.should_grade = exam.was_user_completed and exam_meta is not None
@@ -226,14 +243,11 @@ class ExamApp(App):
         # load main UI styles
         Builder.load_file(os.path.join(os.path.dirname(__file__), 'ui.kv'))
 
-        # scrollview covering the entire window
-        root = ScrollView(size_hint=(1, None), size=(Window.width, Window.height))
-        Window.bind(height=root.setter('height'))
-
-        view = ExamView()
-        root.add_widget(view)
+        return ExamView()
 
-        return root
+    def on_stop(self):
+        # don't lose the answers given since the last autosave
+        self.autosaver.close()
 
     def clear_exam(self):
         """Clears the exam and notifies observers"""
@@ -243,6 +257,7 @@ class ExamApp(App):
         self.should_grade = False
 
         self.alert("The exam has been cleared", title="Notice", size=(300, 100))
+        self.autosaver.schedule()
 
     def save_prompt(self):
         """Opens save prompt"""
@@ -267,21 +282,53 @@ class ExamApp(App):
             self.alert("Exam was saved without user name", title="Notice", size=(300, 100))
 
         try:
-            self.exam.save(self.save_location)
+            self.autosaver.save_now()
         except Exception:
             self.alert(f"Could not save the exam", title="Error")
 
+    def exam_snapshot(self):
+        """Copies the exam and its location on the UI thread, for `autosave`"""
+        return copy.deepcopy(self.exam), self.save_location
+
+    @staticmethod
+    def autosave(snapshot):
+        """Saves an exam snapshot in the background (see `Autosaver`), without completing it"""
+        exam, save_location = snapshot
+        if save_location:
+            save_exam_file(exam, save_location)
+
+    def on_autosave_error(self, ex: Exception):
+        # called from the autosave thread; alerts need to be shown from the UI thread
+        Clock.schedule_once(lambda dt: self.alert("Could not autosave the exam", title="Error"))
+
+    def change_user_name(self, name: str):
+        """Sets the user name and schedules an autosave"""
+        if self.exam.user_name != name:
+            self.exam.user_name = name
+            self.autosaver.schedule()
+
     def grade(self):
         """Attempts to grade the exam"""
-        meta = self.exam_meta
-        max_score = self.exam.max_score
+        self.exam_score.clear()
+        self.update_score()
+
+    def update_score(self):
+        """Updates the score display using cached question scores"""
+        max_score = self.max_score
         if self.should_grade:
-            self.score = self.exam.get_score(meta)
+            self.score = self.exam_score.total
             percent = percentage(self.score, max_score)
             self.score_str = f"{self.score} / {max_score} ({percent:.1f}%)"
         else:
             self.score = NO_SCORE
             self.score_str = f"? / {max_score}"
 
+    def change_answer(self, question):
+        """Regrades a question whose answer has changed and notifies observers"""
+        if self.should_grade:
+            self.exam_score.update(question)
+        self.dispatch('on_answer_changed', question)
+
     def on_answer_changed(self, question):
-        self.grade()
+        self.update_score()
+        self.autosaver.schedule()
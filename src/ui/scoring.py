@@ -0,0 +1,43 @@
+# incremental exam scoring used by the UI (kept free of kivy imports)
+
+
+class ExamScore:
+    """
+    Caches per-question scores of an exam, so that a changed answer
+    only regrades its own question
+    """
+
+    def __init__(self, exam, exam_meta):
+        self.exam = exam
+        self.key = exam_meta.compile() if exam_meta else None
+        self.scores = dict()  # question id -> score
+        self._total = 0
+
+    def clear(self):
+        """Forgets all cached scores"""
+        self.scores = dict()
+        self._total = 0
+
+    def get(self, question) -> int:
+        """Returns the (cached) score of a question"""
+        score = self.scores.get(question.id, None)
+        if score is None:
+            score = question.grade(self.key.find_question(question.id))
+            self.scores[question.id] = score
+            self._total += score
+        return score
+
+    def update(self, question) -> int:
+        """Regrades a question whose answers have changed"""
+        score = self.scores.pop(question.id, None)
+        if score is not None:
+            self._total -= score
+        return self.get(question)
+
+    @property
+    def total(self) -> int:
+        """Returns the exam score; only the questions missing from the cache are graded"""
+        if len(self.scores) < len(self.exam.questions):
+            for question in self.exam.questions:
+                self.get(question)
+        return self._total
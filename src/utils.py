@@ -1,6 +1,13 @@
 # general-purpose utilities
-from typing import Dict, Callable, List
+from typing import Dict, Callable, Iterable, Iterator, List
+from contextlib import contextmanager
+import hashlib
+import itertools
+import os
 import random
+import re
+import shutil
+import tempfile
 
 
 def combine_dictionaries(*args: Dict[str, object]) -> Dict[str, object]:
@@ -34,6 +41,85 @@ def get_weight_list(items, weight_predicate: Callable) -> List:
     return output_list
 
 
+class WeightedSampler:
+    """
+    Weighted random sampling without replacement from a fixed weight table.
+    Each pick takes O(log n) using a Fenwick tree over the weights;
+    the table is restored after every `sample` call, so it can be reused.
+
+    Notes
+        `weight_predicate` must return non-negative integers
+    """
+
+    def __init__(self, items, weight_predicate: Callable):
+        pairs = get_weight_list(items, weight_predicate)
+        self.items = [item for item, _ in pairs]
+        self.weights = [weight for _, weight in pairs]
+        self.total_weight = sum(self.weights)
+
+        # build the (1-based) Fenwick tree in O(n)
+        size = len(self.weights)
+        tree = [0] + self.weights
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self._tree = tree
+        self._top_bit = 1 << (size.bit_length() - 1) if size else 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _add(self, index: int, delta: int):
+        tree = self._tree
+        index += 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def _find(self, rand: int) -> int:
+        """
+        Returns the index of the first item whose weight prefix sum reaches `rand`
+        """
+        tree = self._tree
+        position = 0
+        step = self._top_bit
+        while step:
+            next_position = position + step
+            if next_position < len(tree) and tree[next_position] < rand:
+                position = next_position
+                rand -= tree[next_position]
+            step >>= 1
+        return position
+
+    def sample(self, count: int, rng=random) -> List:
+        """
+        Randomly chooses `count` distinct items
+
+        Args
+            rng: source of randomness (e.g. a seeded `random.Random`)
+        """
+        if count < 0:
+            raise ValueError("`count` should be a positive integer")
+        if len(self.items) < count:
+            raise ValueError("Not enough available items")
+
+        picked = []
+        total_weight = self.total_weight
+        try:
+            while len(picked) < count and total_weight > 0:
+                index = self._find(rng.randint(1, total_weight))
+                picked.append(index)
+                # remove the item until the draw is finished
+                self._add(index, -self.weights[index])
+                total_weight -= self.weights[index]
+        finally:
+            for index in picked:
+                self._add(index, self.weights[index])
+
+        return [self.items[index] for index in picked]
+
+
 def weighted_random(items, weight_predicate: Callable, count: int) -> List:
     """
     Randomly chooses `count` items given a weighing callable.
@@ -44,29 +130,7 @@ def weighted_random(items, weight_predicate: Callable, count: int) -> List:
     if count < 0:
         raise ValueError("`count` should be a positive integer")
 
-    input_list = get_weight_list(items, weight_predicate)
-    if len(input_list) < count:
-        raise ValueError("Not enough available items")
-
-    total_weight = sum(pair[1] for pair in input_list)
-    output_list = []
-
-    while len(output_list) < count and total_weight > 0:
-        rand = random.randint(1, total_weight)
-        # keep subtracting until the prefix sum is greater than `rand`
-        for index, pair in enumerate(input_list):
-            item, weight = pair
-            rand -= weight
-            if rand > 0:
-                continue
-            # include `item`
-            output_list.append(item)
-            total_weight -= weight
-            # remove `item` from list
-            input_list[index] = (None, 0)
-            break
-
-    return output_list
+    return WeightedSampler(items, weight_predicate).sample(count)
 
 
 def get_params(**kwargs) -> dict:
@@ -93,3 +157,65 @@ def short_str(value: str, count: int) -> str:
     if len(value) < count:
         return value
     return value[0:count] + '...'
+
+
+def derive_seed(seed: int, name: str) -> int:
+    """
+    Derives a stable 64-bit seed for `name` from the master `seed`
+    """
+    digest = hashlib.sha256(f"{seed}:{name}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def safe_filename(value: str) -> str:
+    """
+    Replaces characters that aren't safe in file names
+    """
+    return re.sub(r'[^\w.-]+', '_', value.strip()).strip('.') or '_'
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Splits `items` (possibly a lazy iterable) into lists of at most `size` items
+    """
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w'):
+    """
+    Opens a temporary file that atomically replaces `path` once the block succeeds;
+    the file at `path` is either left intact or fully written
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _get_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _get_umask()
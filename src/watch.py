@@ -0,0 +1,226 @@
+# directory watching and incrementally updated grading stats (see `grade-exams --watch`)
+from typing import Dict, List, Optional, Set, Tuple
+import bisect
+import ctypes
+import ctypes.util
+import os
+import select
+import statistics
+import struct
+import sys
+import time
+from stats import RankedUser, rank_users
+from utils import percentage
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+"""int: inotify events of finished writes, renames and deletions"""
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+def is_exam_file(name: str) -> bool:
+    # hidden files include the temporary files of `atomic_write`
+    return not name.startswith('.')
+
+
+class PollingWatcher:
+    """
+    Detects changed files by comparing directory snapshots (modification time and size)
+    """
+
+    def __init__(self, directory: str, interval: float = 0.2):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = dict()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if is_exam_file(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Blocks until some files were created, changed or deleted (or until `timeout`)
+        Returns
+            Paths of the affected files
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {name for name in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(name, None) != self.snapshot.get(name, None)}
+            self.snapshot = snapshot
+            if changed:
+                return {os.path.join(self.directory, name) for name in changed}
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            remaining = self.interval if deadline is None else deadline - time.monotonic()
+            time.sleep(max(0.0, min(self.interval, remaining)))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Receives file events from the Linux kernel (inotify); see `PollingWatcher`
+    """
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.directory = directory
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Could not watch {directory}")
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """See `PollingWatcher.wait`"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 65536)
+
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped; treat every file as changed
+                names.update(name for name in os.listdir(self.directory))
+            elif name:
+                names.add(name)
+        return {os.path.join(self.directory, name) for name in names if is_exam_file(name)}
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watch_directory(directory: str, polling: bool = False):
+    """
+    Returns an inotify-based watcher of `directory` if the platform supports it;
+    otherwise a PollingWatcher
+    """
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            pass  # e.g. out of watches or libc without inotify
+    return PollingWatcher(directory)
+
+
+class LiveSummary:
+    """
+    Grading stats of a directory that follow changes of individual files.
+    Like the other summaries, every user is represented by their latest exam
+    (see `ExamRecord.recency`).
+    Updating a file costs O(log n) plus the moves of a sorted list.
+    """
+
+    def __init__(self):
+        self.records = dict()  # path -> ExamRecord
+        self.user_paths = dict()  # user -> set of paths
+        self.user_scores = dict()  # user -> (score, max_score, percentage)
+        self.question_stats = dict()  # question id -> {score: occurrences}
+        self.histogram = dict()  # user score -> occurrences
+        self._sorted_scores = []
+        self._total = 0
+        self._max_scores = dict()  # max score -> occurrences (over users)
+
+    def update(self, path: str, record):
+        """Replaces the record of a file; None removes it"""
+        previous = self.records.pop(path, None)
+        if previous:
+            self._count_questions(previous, -1)
+            paths = self.user_paths[previous.user]
+            paths.discard(path)
+            if not paths:
+                del self.user_paths[previous.user]
+            self._update_user(previous.user)
+        if record:
+            self.records[path] = record
+            self._count_questions(record, 1)
+            self.user_paths.setdefault(record.user, set()).add(path)
+            self._update_user(record.user)
+
+    def _count_questions(self, record, delta: int):
+        for qid, score in zip(record.questions, record.scores):
+            counts = self.question_stats.setdefault(qid, dict())
+            counts[score] = counts.get(score, 0) + delta
+            if counts[score] == 0:
+                del counts[score]
+                if not counts:
+                    del self.question_stats[qid]
+
+    def _update_user(self, user):
+        old = self.user_scores.pop(user, None)
+        if old:
+            self._count_score(old[0], old[1], -1)
+        paths = self.user_paths.get(user, None)
+        if paths:
+            latest = max(paths, key=lambda path: (self.records[path].recency, path))
+            record = self.records[latest]
+            percent = percentage(record.score, record.max_score)
+            self.user_scores[user] = (record.score, record.max_score, percent)
+            self._count_score(record.score, record.max_score, 1)
+
+    def _count_score(self, score: int, max_score: int, delta: int):
+        if delta > 0:
+            bisect.insort(self._sorted_scores, score)
+        else:
+            del self._sorted_scores[bisect.bisect_left(self._sorted_scores, score)]
+        self._total += delta * score
+        for counts, key in ((self.histogram, score), (self._max_scores, max_score)):
+            counts[key] = counts.get(key, 0) + delta
+            if counts[key] == 0:
+                del counts[key]
+
+    @property
+    def max_score(self) -> int:
+        return max(self._max_scores, default=0)
+
+    def ranked_users(self, limit: Optional[int] = None) -> List[RankedUser]:
+        """See `rank_users`"""
+        return rank_users(self.user_scores, limit)
+
+    def scores(self) -> List[int]:
+        return list(self._sorted_scores)
+
+    def score_histogram(self) -> Dict[int, int]:
+        return dict(self.histogram)
+
+    def general_stats(self) -> Tuple[int, float, float]:
+        """
+        Returns (count, mean, median) of user scores
+        """
+        scores = self._sorted_scores
+        count = len(scores)
+        middle = count // 2
+        median = scores[middle] if count % 2 else (scores[middle - 1] + scores[middle]) / 2
+        return count, self._total / count, median
+
+    def stdev(self) -> float:
+        """Population standard deviation of user scores"""
+        return statistics.pstdev(self._sorted_scores)
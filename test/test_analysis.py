@@ -0,0 +1,77 @@
+import os
+import random
+import numpy as np
+import pytest
+from models import ProblemSet
+from batch import BatchGrader
+from analysis import ItemAnalysis, report_rows, CSV_COLUMNS
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def get_exams(meta, count, num_questions):
+    rng = random.Random(2)
+    exams = []
+    for _ in range(count):
+        exam = meta.generate_exam(num_questions, '', rng=rng)
+        skill = rng.random()
+        for question in exam.questions:
+            for answer in question.answers:
+                answer.is_selected = rng.random() < skill
+        exams.append(exam)
+    return exams
+
+
+def test_item_analysis():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    key = meta.compile()
+    grader = BatchGrader(key)
+    # every exam contains all the questions, so that alpha is the classical one
+    exams = get_exams(meta, 120, len(key.questions))
+
+    analysis = ItemAnalysis(grader)
+    for start in range(0, len(exams), 50):
+        analysis.add(grader.grade(exams[start:start + 50]))
+    report = analysis.report()
+    assert report['exams'] == len(exams)
+
+    # exam x question score matrix
+    question_ids = grader.question_ids
+    matrix = np.zeros((len(exams), len(question_ids)))
+    for row, exam in enumerate(exams):
+        exam.get_score(key, lambda question, points:
+                       matrix.__setitem__((row, question_ids.index(question.id)), points))
+    totals = matrix.sum(axis=1)
+
+    k = len(question_ids)
+    alpha = k / (k - 1) * (1 - matrix.var(axis=0).sum() / totals.var())
+    assert report['cronbach_alpha'] == pytest.approx(alpha, abs=1e-4)
+
+    for index, question in enumerate(report['questions']):
+        assert question['id'] == question_ids[index]
+        assert question['presented'] == len(exams)
+        points = key.questions[question['id']].points
+        assert question['difficulty'] == pytest.approx(matrix[:, index].mean() / points,
+                                                       abs=1e-4)
+        rest = totals - matrix[:, index]
+        expected = np.corrcoef(matrix[:, index], rest)[0, 1]
+        if np.isfinite(expected):
+            assert question['discrimination'] == pytest.approx(expected, abs=1e-4)
+
+        # selection rates of every answer
+        for answer in question['answers']:
+            selections = [ans.is_selected for exam in exams for q in exam.questions
+                          if q.id == question['id'] for ans in q.answers if ans.id == answer['id']]
+            assert answer['presented'] == len(selections)
+            if selections:
+                assert answer['selection_rate'] == pytest.approx(np.mean(selections), abs=1e-4)
+
+    rows = list(report_rows(report))
+    assert all(len(row) == len(CSV_COLUMNS) for row in rows)
+
+
+def test_item_analysis_empty():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    analysis = ItemAnalysis(BatchGrader(meta.compile()))
+    analysis.add(analysis.grader.grade([]))
+    assert analysis.report() == {'exams': 0, 'cronbach_alpha': None, 'questions': []}
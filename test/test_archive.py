@@ -0,0 +1,84 @@
+import os
+import tarfile
+import zipfile
+import pytest
+from click.testing import CliRunner
+from models import ProblemSet
+from archive import ArchiveError, count_members, is_archive, read_members
+from cli import cli, grade_files, list_exams
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+RESULTS_DIR = os.path.join(EXAMPLES_DIR, 'results')
+
+
+def make_archives(tmp_path):
+    names = sorted(os.listdir(RESULTS_DIR))
+    zip_path = str(tmp_path / 'results.zip')
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr('results/', '')
+        archive.writestr('results/.hidden.yml', 'junk')
+        for name in names:
+            archive.write(os.path.join(RESULTS_DIR, name), f'results/{name}')
+    tar_path = str(tmp_path / 'results.tar.gz')
+    with tarfile.open(tar_path, 'w:gz') as archive:
+        archive.add(RESULTS_DIR, 'results')
+    return names, zip_path, tar_path
+
+
+def test_read_members(tmp_path):
+    names, zip_path, tar_path = make_archives(tmp_path)
+    assert not is_archive(RESULTS_DIR) and is_archive(zip_path) and is_archive(tar_path)
+    assert count_members(zip_path) == len(names) and count_members(tar_path) is None
+    for path in (zip_path, tar_path):
+        members = {os.path.basename(member.name): member.data for member in read_members(path)}
+        assert sorted(members) == names
+        with open(os.path.join(RESULTS_DIR, names[0]), 'rb') as file:
+            assert members[names[0]] == file.read()
+
+    corrupted = str(tmp_path / 'corrupted.tar.gz')
+    with open(tar_path, 'rb') as source, open(corrupted, 'wb') as target:
+        target.write(source.read()[:100])
+    with pytest.raises(ArchiveError):
+        list(read_members(corrupted))
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_grade_archives(tmp_path, jobs):
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    _, zip_path, tar_path = make_archives(tmp_path)
+
+    def scores(path):
+        paths, count = list_exams(path)
+        results = list(grade_files(meta, paths, jobs, count))
+        assert all(result.error is None for result in results)
+        return sorted((result.record.user, result.record.score) for result in results)
+
+    expected = scores(RESULTS_DIR)
+    assert len(expected) == 3
+    assert scores(zip_path) == scores(tar_path) == expected
+
+
+def test_analyze_archive_errors(tmp_path):
+    names, zip_path, _ = make_archives(tmp_path)
+    with open(os.path.join(RESULTS_DIR, names[0]), 'r') as file:
+        incomplete = file.read().replace('was_user_completed: true', 'was_user_completed: false')
+    with zipfile.ZipFile(zip_path, 'a') as archive:
+        archive.writestr('results/bad.yml', 'questions: [')
+        archive.writestr('results/binary.yml', bytes(range(256)))
+        archive.writestr('results/incomplete.yml', incomplete)
+
+    problems = os.path.join(EXAMPLES_DIR, 'problems.yml')
+    outputs = dict()
+    for command in ('grade-exams', 'analyze-items'):
+        result = CliRunner(mix_stderr=False).invoke(cli, ['-s', problems, command, zip_path])
+        assert result.exit_code == 0, result.output
+        outputs[command] = result.stdout if command == 'grade-exams' else result.stderr
+
+    # both commands name the invalid files and count the skipped ones per reason
+    for output in outputs.values():
+        lines = output.splitlines()
+        assert any(line.startswith('bad.yml: ') for line in lines)
+        assert any(line.startswith('binary.yml: ') for line in lines)
+        assert not any(line.startswith('incomplete.yml') for line in lines)
+        assert 'Skipped 3 file(s) (invalid: 2, not completed: 1)' in lines
+    assert 'Analyzed 3 exam(s)' in outputs['analyze-items']
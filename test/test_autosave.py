@@ -0,0 +1,69 @@
+import threading
+import time
+from ui.autosave import Autosaver
+
+
+def test_autosave_debounce():
+    saves = []
+    saver = Autosaver(lambda state: saves.append(time.monotonic()), lambda: None, delay=0.05)
+
+    # a burst of changes results in a single save
+    for _ in range(20):
+        saver.schedule()
+    assert saver.pending
+    assert saver.flush(timeout=5)
+    assert len(saves) == 1
+    assert not saver.pending
+
+    # nothing to save
+    assert saver.flush(timeout=5)
+    assert len(saves) == 1
+
+    # saves happen on their own once changes stop
+    saver.schedule()
+    deadline = time.monotonic() + 5
+    while saver.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(saves) == 2
+
+    # synchronous saves cancel the pending one
+    saver.schedule()
+    saver.save_now()
+    saver.close(timeout=5)
+    assert len(saves) == 3
+
+
+def test_autosave_errors():
+    errors = []
+    failed = threading.Event()
+
+    def save(state):
+        raise OSError("disk full")
+
+    def on_error(ex):
+        errors.append(ex)
+        failed.set()
+
+    saver = Autosaver(save, lambda: None, delay=0, on_error=on_error)
+    saver.schedule()
+    assert failed.wait(timeout=5)
+    assert isinstance(errors[0], OSError)
+    # a failed save doesn't stay pending forever
+    assert saver.flush(timeout=5)
+    saver.close(timeout=5)
+
+
+def test_autosave_snapshots():
+    answers = ['a']
+    saved = []
+    saver = Autosaver(saved.append, lambda: list(answers), delay=60)
+
+    # changes made after scheduling aren't seen by the worker
+    saver.schedule()
+    answers.append('b')
+    assert saver.flush(timeout=5)
+    assert saved == [['a']]
+
+    saver.save_now()
+    saver.close(timeout=5)
+    assert saved == [['a'], ['a', 'b']]
@@ -0,0 +1,52 @@
+import os
+import random
+from models import ProblemSet
+from batch import BatchGrader
+from compact import ExamCodec
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def test_batch_grader():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    random.seed(1)
+    exams = []
+    for _ in range(50):
+        exam = meta.generate_exam(8, '')
+        for question in exam.questions:
+            for answer in question.answers:
+                answer.is_selected = random.random() < 0.5
+        exams.append(exam)
+    # unknown answers are never graded
+    exams[0].questions[0].answers[0].id = 999
+
+    key = meta.compile()
+    batch = BatchGrader(key).grade(exams)
+    for index, exam in enumerate(exams):
+        scores = []
+        score = exam.get_score(key, lambda question, points: scores.append(points))
+        assert batch.scores[index] == score
+        assert batch.max_scores[index] == exam.max_score
+        assert batch.exam_scores(index) == scores
+    assert batch.exam_scores(0)[0] == 0
+
+
+def test_grade_compact():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    rng = random.Random(2)
+    exams = []
+    for _ in range(30):
+        exam = meta.generate_exam(rng.randrange(1, 9), '', rng=rng)
+        for question in exam.questions:
+            for answer in question.answers:
+                answer.is_selected = rng.random() < 0.5
+        exams.append(exam)
+    exams[3].questions[0].answers = []  # questions without presented answers
+
+    grader = BatchGrader(meta.compile())
+    codec = ExamCodec(meta, grader.columns)
+    for chunk in (exams, exams[:1], []):
+        batch = grader.grade_compact([codec.encode(exam) for exam in chunk])
+        reference = grader.grade(chunk)
+        for name in batch._fields:
+            assert getattr(batch, name).tolist() == getattr(reference, name).tolist(), name
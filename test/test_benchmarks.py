@@ -0,0 +1,32 @@
+import json
+from click.testing import CliRunner
+import benchmarks.run
+from benchmarks.run import SCALES, compare, main, run_benchmarks, import_time
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks(SCALES['small'], 1, str(tmp_path))
+    assert {'problem_set_load', 'generate_exams', 'grade_exams', 'ui_grade',
+            'startup_help', 'startup_list_questions', 'cli_import'} <= set(results)
+    assert all(result['min'] >= 0 and result['repeat'] == 1 for result in results.values())
+
+
+def test_compare(tmp_path):
+    baseline = {'results': {'a': {'min': 1.0}, 'b': {'min': 1.0}, 'c': {'min': 0}}}
+    current = {'results': {'a': {'min': 1.2}, 'b': {'min': 1.3}, 'c': {'min': 1.0},
+                           'd': {'min': 5.0}}}
+    assert compare(current, baseline, 1.25) == ['b']
+
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps({'scale': 'small', 'results': {'ui_grade': {'min': 1e-12}}}))
+    result = CliRunner().invoke(main, ['-r', '1', '--only', 'ui_grade', '-c', str(path)])
+    assert result.exit_code == 1 and 'ui_grade' in result.output
+
+
+def test_import_budget(monkeypatch):
+    assert 0 < import_time('cli') < 60
+    result = CliRunner().invoke(main, ['-r', '1', '--only', 'cli_import'])
+    assert result.exit_code == 0, result.output
+    monkeypatch.setattr(benchmarks.run, 'IMPORT_BUDGET', 1e-9)
+    result = CliRunner().invoke(main, ['-r', '1', '--only', 'cli_import'])
+    assert result.exit_code == 1 and 'Over budget: cli_import' in result.output
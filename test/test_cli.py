@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+from click.testing import CliRunner
+from models import ProblemSet
+from cli import cli, grade_files, grade_chunk, GradingSummary, save_plot
+import profiling
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+RESULTS_DIR = os.path.join(EXAMPLES_DIR, 'results')
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+HEAVY_MODULES = ['matplotlib', 'numpy', 'kivy']
+"""List[str]: modules that must only be imported by the commands that need them"""
+
+
+def get_summary(meta, jobs):
+    paths = sorted(os.path.join(RESULTS_DIR, file) for file in os.listdir(RESULTS_DIR))
+    summary = GradingSummary()
+    for record, error, _ in grade_files(meta, paths, jobs):
+        assert error is None
+        summary.add(record)
+    return summary
+
+
+def test_grade_files_parallel():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    serial = get_summary(meta, 1)
+    parallel = get_summary(meta, 2)
+    assert len(serial.user_scores) == 3
+    assert serial.user_scores == parallel.user_scores
+    assert serial.question_stats == parallel.question_stats
+    assert serial.max_score == parallel.max_score
+
+
+def test_lazy_imports():
+    # a fresh interpreter is needed, since other tests import the heavy modules
+    code = f"import sys, cli; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=SRC_DIR)
+    assert output.decode().strip() == '[]'
+
+
+def test_skipped_exams(tmp_path):
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    with open(os.path.join(RESULTS_DIR, 'baz.yml'), 'r') as file:
+        text = file.read()
+    variants = {
+        'graded': text,
+        'incomplete': text.replace('was_user_completed: true', 'was_user_completed: false'),
+        'foreign': text.replace(str(meta.uuid), '00000000-0000-0000-0000-000000000000'),
+        'invalid': 'questions: [',
+    }
+    paths = []
+    for name, content in variants.items():
+        path = str(tmp_path / f'{name}.yml')
+        with open(path, 'w') as file:
+            file.write(content)
+        paths.append(path)
+
+    results = grade_chunk(meta.compile(), None, paths)
+    assert results[0].record is not None and results[0].error is None
+    assert [result.reason for result in results] == \
+        [None, 'not completed', 'other problem set', 'invalid']
+
+
+def test_save_plot(tmp_path):
+    # one tick per participant used to make this take minutes
+    histogram = {score: 1000 for score in range(50)}
+    for name in ('scores.png', 'scores.svg', 'scores.txt'):
+        path = str(tmp_path / name)
+        save_plot(histogram, 49, path)
+        assert os.path.getsize(path) > 0
+    with open(str(tmp_path / 'scores.txt')) as file:
+        assert file.readline() == 'Score histogram:\n'
+
+
+def test_profile(tmp_path):
+    stats_path = str(tmp_path / 'grading.prof')
+    args = ['-s', os.path.join(EXAMPLES_DIR, 'problems.yml'), '--profile-out', stats_path,
+            'grade-exams', RESULTS_DIR, '--jobs', '2']
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert profiling.profiler is None
+    assert os.path.getsize(stats_path) > 0
+
+    # stages of the worker processes are included
+    stages = {line.split()[0]: line.split() for line in result.output.splitlines()
+              if line.startswith(('load exam', 'batch grade', 'list files'))}
+    assert stages.keys() == {'load', 'batch', 'list'}
+    assert stages['load'][2] == str(len(os.listdir(RESULTS_DIR)))
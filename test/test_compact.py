@@ -0,0 +1,74 @@
+import os
+import random
+import related
+import pytest
+import loader
+from compact import ExamCodec, pack_bits, get_bit, read_exam, resolve_texts, save_exam, \
+    is_reference_exam, to_reference_data, from_reference_data
+from models import Exam, ProblemSet, SchemeError
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def test_pack_bits():
+    values = [random.random() < 0.5 for _ in range(37)]
+    bits = pack_bits(values)
+    assert len(bits) == 5
+    assert [get_bit(bits, i) for i in range(len(values))] == values
+
+
+def test_compact_exam():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    codec = ExamCodec(meta)
+    key_codec = ExamCodec(meta.compile(), codec.columns)
+    rng = random.Random(1)
+
+    for _ in range(20):
+        exam = meta.generate_exam(6, 'description', rng=rng)
+        for question in exam.questions:
+            for answer in question.answers:
+                answer.is_selected = rng.random() < 0.5
+        exam.user_name = 'user'
+
+        compact = codec.encode(exam)
+        assert not hasattr(compact, '__dict__')
+        assert len(compact) == len(exam.questions)
+        assert compact.max_score == exam.max_score
+        assert codec.get_score(compact) == exam.get_score(meta)
+
+        # converts back to an identical exam; without texts if only the key is known
+        assert related.to_yaml(codec.decode(compact)) == related.to_yaml(exam)
+        decoded = key_codec.decode(compact)
+        assert decoded.questions[0].text == '' and decoded.get_score(meta) == exam.get_score(meta)
+
+    # answers that aren't in the problem set can't be interned
+    exam.questions[0].answers[0].id = 1000
+    with pytest.raises(SchemeError):
+        codec.encode(exam)
+
+
+def test_reference_exam(tmp_path):
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    results_dir = os.path.join(EXAMPLES_DIR, 'results')
+    for name in os.listdir(results_dir):
+        exam = loader.load_file(os.path.join(results_dir, name), Exam, reader=read_exam)
+        assert not is_reference_exam(exam)
+
+        path = str(tmp_path / name)
+        save_exam(exam, path, reference=True)
+        assert os.path.getsize(path) < os.path.getsize(os.path.join(results_dir, name)) / 2
+
+        loaded = loader.load_file(path, Exam, reader=read_exam)
+        assert is_reference_exam(loaded)
+        assert loaded.get_score(meta) == exam.get_score(meta)
+        resolve_texts(loaded, meta)
+        assert related.to_yaml(loaded) == related.to_yaml(exam)
+
+        # the format is kept when saving again
+        save_exam(loaded, path)
+        assert is_reference_exam(loader.load_file(path, Exam, reader=read_exam))
+
+    data = to_reference_data(exam)
+    data['version'] += 1
+    with pytest.raises(SchemeError):
+        from_reference_data(data)
@@ -37,3 +37,10 @@ def test_binary_grader():
 def test_linear_grader():
     score = linear_grader(sample_meta, sample_question)
     assert score == 2
+
+
+def test_compiled_graders():
+    key = sample_meta.compile()
+    assert key.correct_ids == {1, 2}
+    assert binary_grader(key, sample_question) == binary_grader(sample_meta, sample_question)
+    assert linear_grader(key, sample_question) == linear_grader(sample_meta, sample_question)
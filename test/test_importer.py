@@ -0,0 +1,70 @@
+import io
+from models import ProblemSet
+from click.testing import CliRunner
+from cli import cli
+from importer import QuestionImporter, read_rows
+
+CSV_ROWS = """question_id,text,points,answer,is_correct
+q1,2+2=,2,4,yes
+q1,,,5,no
+q2,Bad,many,1,
+q3,Bad answer,,,maybe
+"""
+
+
+def import_rows(meta, stream, format):
+    importer = QuestionImporter(meta)
+    for number, row in enumerate(read_rows(stream, format), 1):
+        importer.add_row(number, row)
+    return importer
+
+
+def test_import_csv():
+    meta = ProblemSet()
+    importer = import_rows(meta, io.StringIO(CSV_ROWS), 'csv')
+
+    assert importer.num_questions == 1
+    assert importer.num_answers == 2
+    assert [number for number, _ in importer.errors] == [3, 4]
+    assert meta.find_question('q2') is None
+
+    question = meta.find_question('q1')
+    assert question.points == 2
+    assert [(ans.id, ans.text, ans.is_correct) for ans in question.answers] == \
+        [(1, '4', True), (2, '5', False)]
+
+
+def test_import_jsonl():
+    meta = ProblemSet()
+    question = meta.insert_question(False, 'q1')
+    question.insert_answer(3, text='existing')
+
+    rows = '{"question_id": "q1", "answers": [{"answer": "a"}, {"answer": "b"}]}\n'
+    importer = import_rows(meta, io.StringIO(rows), 'jsonl')
+    assert importer.errors == []
+    # new ids continue after the existing answers
+    assert [ans.id for ans in question.answers] == [3, 4, 5]
+
+
+def test_import_invalid_jsonl(tmp_path):
+    rows = '\n'.join([
+        '{"question_id": "a", "answer": "first"}',
+        '{"question_id": "b", "answers": "oops"}',
+        '{"question_id": "c", "answers": [{"answer": "x", "is_correct": 5}]}',
+        '{"question_id": "d", ',
+        '{"question_id": "e", "answer": "last", "points": null}'
+    ])
+    importer = import_rows(ProblemSet(), io.StringIO(rows), 'jsonl')
+    assert [number for number, _ in importer.errors] == [2, 3, 4]
+    assert importer.num_questions == 2
+
+    # the command reports the invalid rows and saves the rest
+    path = tmp_path / 'problems.yml'
+    ProblemSet(title='Test').save(str(path))
+    rows_path = tmp_path / 'rows.jsonl'
+    rows_path.write_text(rows)
+    result = CliRunner().invoke(cli, ['-s', str(path), 'import-questions', str(rows_path)])
+    assert result.exit_code == 0, result.output
+    assert 'Row #2: `answers` should be a list of mappings' in result.output
+    assert 'Row #4: invalid JSON' in result.output
+    assert set(ProblemSet.from_file(str(path)).questions) == {'a', 'e'}
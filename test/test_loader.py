@@ -0,0 +1,53 @@
+import io
+import os
+import shutil
+import yaml
+from models import Exam
+from loader import ParseCache, load_file, scan_header
+
+EXAM_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples', 'exam.yml')
+
+
+def test_load_file():
+    exam = load_file(EXAM_PATH, Exam)
+    assert len(exam.questions) > 0
+
+
+def test_parse_cache(tmp_path):
+    path = str(tmp_path / 'exam.yml')
+    shutil.copy(EXAM_PATH, path)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    parsed = []
+
+    def parse(path):
+        parsed.append(path)
+        return load_file(path, Exam)
+
+    first = cache.load(path, Exam, parse)
+    second = cache.load(path, Exam, parse)
+    assert len(parsed) == 1
+    assert first == second
+
+    # modified files are parsed again
+    with open(path, 'a') as file:
+        file.write('user_name: Someone\n')
+    third = cache.load(path, Exam, parse)
+    assert len(parsed) == 2
+    assert third.user_name == 'Someone'
+
+
+def test_scan_header():
+    with open(EXAM_PATH, 'r') as file:
+        header = scan_header(file, ['meta_uuid', 'was_user_completed', 'user_name', 'title'])
+    exam = load_file(EXAM_PATH, Exam)
+    assert header['meta_uuid'] == str(exam.meta_uuid)
+    assert header['was_user_completed'] == exam.was_user_completed
+    assert header['title'] == exam.title
+
+    stream = io.StringIO("a: [1, {b: 2}]\nb: 'yes'\nc: Off\nd: ~\ne: {f: 3}\nf: 4")
+    assert scan_header(stream, 'abcdef') == {'b': 'yes', 'c': False, 'd': None, 'f': '4'}
+    assert scan_header(io.StringIO("- a: 1"), ['a']) == dict()
+
+    # the same spellings as the full parse
+    stream = "a: tRuE\nb: YES\nc: nO\nd: FALSE\ne: yEs"
+    assert scan_header(io.StringIO(stream), 'abcde') == yaml.safe_load(stream)
@@ -1,4 +1,10 @@
-from models import ProblemSet, ExamQuestionMeta, SchemeError
+import os
+import random
+import related
+import uuid
+import pytest
+from models import ProblemSet, ExamQuestionMeta, ExamGenerator, SchemeError, \
+    ExamQuestionAnswer, Mismatch
 
 
 def test_insert_question():
@@ -58,3 +64,63 @@ def test_prepare_answers():
         # not enough answers to pick from
         return
     raise Exception("Picks disabled answers")
+
+
+def test_compile():
+    problems = ProblemSet()
+    question = problems.insert_question(False, 'test', points=3)
+    question.insert_answer(text='1', is_correct=True)
+    question.insert_answer(text='2')
+
+    key = problems.compile()
+    compiled = key.find_question('test')
+    assert compiled.id == 'test'
+    assert compiled.points == 3
+    assert compiled.answer_ids == {1, 2}
+    assert compiled.correct_ids == {1}
+    assert key.find_question('missing') is None
+
+
+def test_generate_exam_seeded():
+    path = os.path.join(os.path.dirname(__file__), '..', 'examples', 'problems.yml')
+    problems = ProblemSet.from_file(path)
+    generator = ExamGenerator(problems)
+
+    def dump(exam):
+        exam.generated_at = None
+        return related.to_yaml(exam)
+
+    first = problems.generate_exam(5, '', rng=random.Random(42))
+    second = generator.generate(5, '', rng=random.Random(42))
+    third = generator.generate(5, '', rng=random.Random(42))
+    assert dump(first) == dump(second) == dump(third)
+
+
+def test_exam_compatibility():
+    path = os.path.join(os.path.dirname(__file__), '..', 'examples', 'problems.yml')
+    problems = ProblemSet.from_file(path)
+    exam = problems.generate_exam(3, '', rng=random.Random(1))
+    for meta in (problems, problems.compile()):
+        meta.ensure_exam_compatibility(exam)
+
+    first, second, third = exam.questions
+    first.points += 1
+    second.answers.append(ExamQuestionAnswer(id=999))
+    second.answers.append(ExamQuestionAnswer(id=second.answers[0].id))
+    third.id = 'unknown'
+    exam.questions.append(first)
+    exam.meta_uuid = uuid.uuid4()
+
+    expected = [
+        Mismatch('uuid', expected=problems.uuid, actual=exam.meta_uuid),
+        Mismatch('points', first.id, expected=first.points - 1, actual=first.points),
+        Mismatch('missing answer', second.id, 999),
+        Mismatch('duplicate answer', second.id, second.answers[0].id),
+        Mismatch('missing question', 'unknown'),
+        Mismatch('duplicate question', first.id)
+    ]
+    for meta in (problems, problems.compile()):
+        with pytest.raises(SchemeError) as error:
+            meta.ensure_exam_compatibility(exam)
+        assert list(error.value.mismatches) == expected
+        assert '1 more' in str(error.value)
@@ -0,0 +1,47 @@
+import io
+from models import ProblemSet
+from operations import read_operations, apply_operation, OperationError
+
+OPERATIONS = """
+{"op": "add-question", "id": "q1", "text": "2+2=", "points": 2}
+{"op": "add-answer", "question_id": "q1", "text": "4", "is_correct": true}
+{"op": "add-answer", "question_id": "q1", "text": "5"}
+{"op": "edit-question", "id": "q1", "is_multiple_choice": false, "points": 3}
+{"op": "edit-defaults", "likelihood": 5}
+"""
+
+
+def test_apply_operations():
+    meta = ProblemSet()
+    for operation in read_operations(io.StringIO(OPERATIONS), 'jsonl'):
+        apply_operation(meta, operation)
+
+    question = meta.find_question('q1')
+    assert question.text == '2+2='
+    assert question.points == 3
+    assert [ans.id for ans in question.answers] == [1, 2]
+    assert question.find_answer(1).is_correct
+    assert meta.question_defaults.likelihood == 5
+
+
+def test_read_yaml_operations():
+    stream = io.StringIO("op: add-question\nid: q1\n---\nop: edit-defaults\npoints: 2\n")
+    operations = list(read_operations(stream, 'yaml'))
+    assert [operation['op'] for operation in operations] == ['add-question', 'edit-defaults']
+
+
+def test_invalid_operations():
+    meta = ProblemSet()
+    invalid = [
+        {'op': 'remove-question', 'id': 'q1'},
+        {'op': 'add-question', 'id': 'q1', 'points': 'many'},
+        {'op': 'add-question', 'id': 'q1', 'grader': 'unknown'},
+        {'op': 'add-answer', 'question_id': 'missing', 'text': '1'},
+        {'op': 'edit-question', 'id': 'missing'},
+    ]
+    for operation in invalid:
+        try:
+            apply_operation(meta, operation)
+        except OperationError:
+            continue
+        raise Exception(f"Accepts invalid operation {operation}")
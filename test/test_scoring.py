@@ -0,0 +1,23 @@
+import os
+from models import ProblemSet
+from ui.scoring import ExamScore
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def test_exam_score():
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    exam = meta.generate_exam(6, '')
+    score = ExamScore(exam, meta)
+    assert score.total == exam.get_score(meta)
+
+    # select every answer of every question, one click at a time
+    for question in exam.questions:
+        for answer in question.answers:
+            answer.is_selected = True
+            score.update(question)
+            assert score.total == exam.get_score(meta)
+
+    score.clear()
+    assert score.scores == dict()
+    assert score.total == exam.get_score(meta)
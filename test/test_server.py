@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import yaml
+from cli import load_exam
+from models import ProblemSet
+from server import GradingService, ServiceError, generate_payload, _init_service_worker
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+RESULTS_DIR = os.path.join(EXAMPLES_DIR, 'results')
+YAML = 'application/x-yaml'
+
+
+@pytest.fixture(params=[1, 2], ids=['thread', 'processes'])
+def service_url(request):
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    service = GradingService([meta], jobs=request.param)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.sockets[0].getsockname()[1])
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    service.close()
+
+
+def call(url, data=None, content_type='application/json'):
+    request = urllib.request.Request(url, data, {'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as ex:
+        return ex.code, ex.read().decode()
+
+
+def test_grade(service_url):
+    meta = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml'))
+    expected = dict()  # user -> score
+    payloads = []
+    for name in sorted(os.listdir(RESULTS_DIR)):
+        path = os.path.join(RESULTS_DIR, name)
+        exam = load_exam(path)
+        expected[exam.user_name] = exam.get_score(meta)
+        with open(path, 'rb') as file:
+            payloads.append(file.read())
+
+    # concurrent requests
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda payload: call(service_url + '/grade', payload, YAML),
+                                  payloads * 4))
+    for status, body in responses:
+        assert status == 200
+        result = json.loads(body)
+        assert result['score'] == expected[result['user_name']]
+        assert result['score'] == sum(question['score'] for question in result['questions'])
+
+    # answers unknown to the problem set
+    tampered = payloads[0].replace(b'- id: 1\n', b'- id: 99\n', 1)
+    status, body = call(service_url + '/grade', tampered, YAML)
+    assert status == 422
+    assert json.loads(body)['details'][0]['kind'] == 'missing answer'
+    assert call(service_url + '/grade', b'questions: [', YAML)[0] == 400
+
+    # exams that don't name their problem set
+    for payload in (b'{}', b'{"meta_uuid": "x"}', payloads[0].replace(b'meta_uuid:', b'uuid:')):
+        status, body = call(service_url + '/grade', payload, YAML)
+        assert status == 400 and 'meta_uuid' in json.loads(body)['error']
+
+    stats = json.loads(call(service_url + '/stats')[1])
+    assert stats['routes']['POST /grade']['requests'] == len(payloads) * 4 + 5
+    assert stats['routes']['POST /grade']['errors'] == 5
+
+
+def test_malformed_requests(service_url):
+    host, port = service_url.rsplit('/', 1)[1].split(':')
+    for request in (b'GARBAGE\r\n\r\n', b'GET /health FTP/1.0\r\n\r\n',
+                    b'POST /grade HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+                    b'POST /grade HTTP/1.1\r\nContent-Length: x\r\n\r\n'):
+        with socket.create_connection((host, int(port)), timeout=5) as connection:
+            connection.sendall(request)
+            response = b''
+            while True:
+                data = connection.recv(4096)
+                if not data:
+                    break
+                response += data
+        assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+        assert b'Connection: close' in response
+
+
+def test_generate(service_url):
+    request = json.dumps({'num_questions': 3, 'seed': 5, 'user_name': 'ann'}).encode()
+    status, first = call(service_url + '/generate', request)
+    assert status == 200
+    exam = yaml.safe_load(first)
+    assert exam['user_name'] == 'ann' and len(exam['questions']) == 3
+    # the same seed and user name reproduce the exam
+    second = call(service_url + '/generate', request)[1]
+    assert first.split('questions:')[1] == second.split('questions:')[1]
+
+    assert call(service_url + '/generate', b'{}')[0] == 400
+    assert call(service_url + '/generate', b'{"problem_set": "x", "num_questions": 1}')[0] == 404
+    assert call(service_url + '/missing')[0] == 404
+    assert call(service_url + '/health')[1] == '{"status": "ok"}'
+
+
+def test_unsafe_payloads(service_url, tmp_path):
+    marker = tmp_path / 'executed'
+    payload = f'!!python/object/apply:os.system ["touch {marker}"]'.encode()
+    # cross-origin pages can only send "simple" content types without a preflight
+    assert call(service_url + '/grade', payload, 'text/plain')[0] == 415
+    assert call(service_url + '/generate', b'{"num_questions": 1}', 'text/plain')[0] == 415
+    for content_type in (YAML, 'application/json'):
+        assert call(service_url + '/grade', payload, content_type)[0] == 400
+    assert not marker.exists()
+
+
+def test_generate_invalid_problem_set():
+    problems = ProblemSet()
+    question = problems.insert_question(False, 'q', num_answers=3, num_correct_answers=1)
+    question.insert_answer(text='only', is_correct=True)
+    _init_service_worker([problems])
+    with pytest.raises(ServiceError) as error:
+        generate_payload({'num_questions': 1})
+    assert error.value.status == 422
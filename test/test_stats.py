@@ -0,0 +1,62 @@
+import random
+import statistics
+import pytest
+from cli import ExamRecord, display_user_stats
+from stats import RunningStats, TopK, StreamingSummary, rank_users
+
+
+def test_running_stats():
+    rng = random.Random(0)
+    for count in (1, 2, 3, 10, 101, 1000):
+        values = [rng.randrange(50) for _ in range(count)]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        assert stats.count == count
+        assert stats.mean == pytest.approx(statistics.mean(values))
+        assert stats.variance == pytest.approx(statistics.pvariance(values))
+        assert stats.median() == statistics.median(values)
+        assert len(stats.histogram) <= 50
+
+
+def test_top_k():
+    rng = random.Random(0)
+    items = [(rng.randrange(20), index) for index in range(200)]
+    top = TopK(5)
+    for key, index in items:
+        top.add(key, index)
+    assert len(top) == 5
+    # best first; ties keep the earlier items
+    expected = sorted(items, key=lambda item: (-item[0], item[1]))[:5]
+    assert top.items() == expected
+
+
+def test_streaming_summary():
+    summary = StreamingSummary(2)
+    for index, score in enumerate([3, 9, 6, 1]):
+        summary.add(ExamRecord(f"user{index}", score, 10, ('a',), (score,)))
+    assert summary.general_stats() == (4, 4.75, 4.5)
+    assert summary.ranked_users() == [('user1', (9, 10, 90.0)), ('user2', (6, 10, 60.0))]
+    assert summary.ranked_users(1) == [('user1', (9, 10, 90.0))]
+    assert summary.stdev() == pytest.approx(statistics.pstdev([3, 9, 6, 1]))
+    assert summary.question_stats == {'a': {3: 1, 9: 1, 6: 1, 1: 1}}
+    assert summary.max_score == 10
+
+
+def test_streaming_summary_repeated_users(capsys):
+    # every exam is ranked separately, even when a user has several
+    summary = StreamingSummary(3)
+    for user, score in [('ann', 10), ('ann', 9), ('bob', 1)]:
+        summary.add(ExamRecord(user, score, 10, (), ()))
+    assert summary.ranked_users() == [('ann', (10, 10, 100.0)), ('ann', (9, 10, 90.0)),
+                                      ('bob', (1, 10, 10.0))]
+    display_user_stats(summary.ranked_users())
+    assert capsys.readouterr().out.splitlines()[1:4] == \
+        ['1. ann: 10.0 / 10.0 (100.0%)', '2. ann: 9.0 / 10.0 (90.0%)', '3. bob: 1.0 / 10.0 (10.0%)']
+
+
+def test_rank_users():
+    user_scores = {'ann': (5, 10, 50.0), 'bob': (9, 10, 90.0), 'cid': (5, 10, 50.0)}
+    assert rank_users(user_scores) == [('bob', (9, 10, 90.0)), ('ann', (5, 10, 50.0)),
+                                       ('cid', (5, 10, 50.0))]
+    assert rank_users(user_scores, 2) == rank_users(user_scores)[:2]
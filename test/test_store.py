@@ -0,0 +1,64 @@
+import os
+import re
+import shutil
+import sqlite3
+import pytest
+from models import ProblemSet
+from cli import grade_files, grade_exam, load_exam, GradingSummary
+from store import ResultsStore
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def test_results_store(tmp_path):
+    directory = tmp_path / 'results'
+    shutil.copytree(os.path.join(EXAMPLES_DIR, 'results'), str(directory))
+    paths = sorted(str(directory / file) for file in os.listdir(str(directory)))
+    key = ProblemSet.from_file(os.path.join(EXAMPLES_DIR, 'problems.yml')).compile()
+
+    store = ResultsStore(str(tmp_path / 'results.db'), key)
+    summary = GradingSummary()
+    # a user's latest exam counts, even if it isn't the last file
+    with open(paths[2], 'r') as file:
+        text = re.sub(r"completed_at: .*", "completed_at: '2999-01-01T00:00:00'", file.read())
+    paths.insert(0, str(directory / 'a_retake.yml'))
+    with open(paths[0], 'w') as file:
+        file.write(text.replace('is_selected: true', 'is_selected: false'))
+    pending = store.sync(paths)
+    assert pending == paths
+    for path, (record, error, _) in zip(pending, grade_files(key, pending)):
+        store.add(path, record, error)
+        summary.add(record)
+    store.commit()
+
+    assert store.user_scores == summary.user_scores
+    assert len(store.user_scores) == 3
+    retake = grade_exam(key, load_exam(paths[0]))
+    assert store.user_scores[retake.user][0] == retake.score
+    assert store.question_stats == summary.question_stats
+    assert store.max_score == summary.max_score
+    assert store.general_stats() == summary.general_stats()
+    assert store.score_histogram() == summary.score_histogram()
+    assert store.ranked_users() == summary.ranked_users()
+    assert store.stdev() == pytest.approx(summary.stdev())
+
+    # unchanged (or only touched) files are skipped
+    os.utime(paths[0], ns=(0, 0))
+    assert store.sync(paths) == []
+    with open(paths[1], 'a') as file:
+        file.write('\n')
+    assert store.sync(paths) == [paths[1]]
+
+    store.close()
+
+    # removed files are forgotten
+    with ResultsStore(str(tmp_path / 'results.db'), key) as store:
+        store.sync(paths[2:])
+        assert len(store.user_scores) == 2
+
+    # stores of an older schema are recreated
+    connection = sqlite3.connect(str(tmp_path / 'results.db'))
+    connection.execute('PRAGMA user_version = 1')
+    connection.close()
+    with ResultsStore(str(tmp_path / 'results.db'), key) as store:
+        assert store.sync(paths) == paths
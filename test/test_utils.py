@@ -1,4 +1,7 @@
-from utils import weighted_random, combine_dictionaries, percentage, get_params
+import os
+import random
+from utils import weighted_random, combine_dictionaries, percentage, get_params, \
+    WeightedSampler, derive_seed, safe_filename, atomic_write
 
 
 def test_random():
@@ -27,6 +30,34 @@ def test_random_zero():
     raise Exception("Doesn't ignore zero-weights")
 
 
+def linear_weighted_random(items, weight_predicate, count, rng):
+    # reference prefix-sum implementation
+    pairs = [(item, weight_predicate(item)) for item in items if weight_predicate(item) > 0]
+    total_weight = sum(weight for _, weight in pairs)
+    output = []
+    while len(output) < count and total_weight > 0:
+        rand = rng.randint(1, total_weight)
+        for index, (item, weight) in enumerate(pairs):
+            rand -= weight
+            if rand <= 0:
+                output.append(item)
+                total_weight -= weight
+                pairs[index] = (None, 0)
+                break
+    return output
+
+
+def test_weighted_sampler():
+    objs = list(range(0, 50))
+    sampler = WeightedSampler(objs, lambda x: x % 7)
+    assert len(sampler) == 42
+    for seed in range(20):
+        expected = linear_weighted_random(objs, lambda x: x % 7, 10, random.Random(seed))
+        # the table is reused between draws
+        assert sampler.sample(10, random.Random(seed)) == expected
+    assert sorted(sampler.sample(42)) == [x for x in objs if x % 7]
+
+
 def test_combine_dicts():
     first = {'One': 1, 'Two': 2, 'Three': 3}
     second = {'foo.yml': 'bar', 'Two': 4}
@@ -47,3 +78,29 @@ def test_get_params():
     result = get_params(**kwargs)
     assert len(result) == 1
     assert 'foo.yml' in result
+
+
+def test_derive_seed():
+    assert derive_seed(1, 'foo') == derive_seed(1, 'foo')
+    assert derive_seed(1, 'foo') != derive_seed(2, 'foo')
+    assert derive_seed(1, 'foo') != derive_seed(1, 'bar')
+
+
+def test_safe_filename():
+    assert safe_filename('Foo Bar') == 'Foo_Bar'
+    assert safe_filename('../x') == '_x'
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / 'file.txt')
+    with atomic_write(path) as file:
+        file.write('first')
+    try:
+        with atomic_write(path) as file:
+            file.write('second')
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    with open(path) as file:
+        assert file.read() == 'first'
+    assert os.listdir(str(tmp_path)) == ['file.txt']
@@ -0,0 +1,70 @@
+import os
+import random
+import statistics
+import pytest
+from cli import ExamRecord
+from watch import LiveSummary, PollingWatcher, watch_directory
+
+
+@pytest.mark.parametrize('polling', [True, False])
+def test_watcher(tmp_path, polling):
+    directory = str(tmp_path)
+    watcher = watch_directory(directory, polling)
+    try:
+        path = os.path.join(directory, 'exam.yml')
+        with open(path, 'w') as file:
+            file.write('user_name: a')
+        assert watcher.wait(5) == {path}
+
+        # temporary files of atomic writes are ignored
+        with open(os.path.join(directory, '.exam.yml.tmp'), 'w') as file:
+            file.write('user_name: b')
+        os.replace(os.path.join(directory, '.exam.yml.tmp'), path)
+        assert watcher.wait(5) == {path}
+
+        os.unlink(path)
+        assert watcher.wait(5) == {path}
+        assert watcher.wait(0.05) == set()
+    finally:
+        watcher.close()
+
+
+def test_polling_watcher_timeout(tmp_path):
+    watcher = PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.wait(0.05) == set()
+
+
+def test_live_summary():
+    rng = random.Random(0)
+    summary = LiveSummary()
+    records = dict()
+
+    for _ in range(500):
+        path = f"exam{rng.randrange(50)}.yml"
+        if rng.random() < 0.2:
+            record = None
+        else:
+            scores = tuple(rng.randrange(3) for _ in range(3))
+            completed_at = rng.choice([None, '2020-01-01T10:00:00', '2020-01-02T09:00:00'])
+            record = ExamRecord(f"user{rng.randrange(30)}", sum(scores), 6,
+                                ('a', 'b', 'c'), scores, completed_at, path)
+        summary.update(path, record)
+        records[path] = record
+
+        # compare with stats computed from scratch; the latest exam of a user counts
+        latest = dict()
+        for record in sorted((record for record in records.values() if record),
+                             key=lambda record: (record.completed_at or '', record.source)):
+            latest[record.user] = record.score
+        assert sorted(summary.scores()) == sorted(latest.values())
+        assert sum(summary.histogram.values()) == len(latest)
+        if latest:
+            count, mean, median = summary.general_stats()
+            assert count == len(latest)
+            assert mean == pytest.approx(statistics.mean(latest.values()))
+            assert median == statistics.median(latest.values())
+            assert summary.stdev() == pytest.approx(statistics.pstdev(latest.values()))
+            assert [score for _, (score, *_) in summary.ranked_users()] == \
+                sorted(latest.values(), reverse=True)
+        counts = sum(sum(stats.values()) for stats in summary.question_stats.values())
+        assert counts == 3 * sum(1 for record in records.values() if record)